@@ -1,17 +1,79 @@
-from fastapi_users import FastAPIUsers
+from typing import Optional
+
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi_users import FastAPIUsers, exceptions
 from fastapi_users.authentication import CookieTransport, AuthenticationBackend
 from fastapi_users.authentication import JWTStrategy
+from fastapi_users.jwt import decode_jwt, generate_jwt
 
+from auth.cache import ROLE_FIELDS, build_user, get_cached_user, cache_user
 from auth.manager import get_user_manager
 from auth.models import User
-from config import SECRET
+from config import SECRET, JWT_ROLE_CLAIMS
+from logger import bind_log_context
 
 
 cookie_transport = CookieTransport(cookie_max_age=3600)
 
 
-def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+class CachedJWTStrategy(JWTStrategy):
+    def __init__(self, *args, role_claims: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.role_claims = role_claims
+
+    def decode(self, token: Optional[str]) -> Optional[dict]:
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+        except jwt.PyJWTError:
+            return None
+        if data.get('sub') is None:
+            return None
+        return data
+
+    async def read_token(self, token: Optional[str], user_manager) -> Optional[User]:
+        data = self.decode(token)
+        if data is None:
+            return None
+        try:
+            user_id = user_manager.parse_id(data['sub'])
+        except exceptions.InvalidID:
+            return None
+
+        user = await get_cached_user(user_id)
+        if user is None:
+            try:
+                user = await user_manager.get(user_id)
+            except exceptions.UserNotExists:
+                return None
+            await cache_user(user)
+        bind_log_context(user_id=user.id)
+        return user
+
+    def read_claims(self, token: Optional[str]) -> Optional[User]:
+        # The user as the token describes it: id and role flags only, the rest of the row is not loaded
+        data = self.decode(token)
+        if data is None or not isinstance(data.get('roles'), dict):
+            return None
+        try:
+            user_id = int(data['sub'])
+        except ValueError:
+            return None
+        bind_log_context(user_id=user_id)
+        return build_user({'id': user_id, **{field: bool(data['roles'].get(field)) for field in ROLE_FIELDS}})
+
+    async def write_token(self, user: User) -> str:
+        data = {'sub': str(user.id), 'aud': self.token_audience}
+        if self.role_claims:
+            # Role changes only reach these claims once the token is reissued
+            data['roles'] = {field: getattr(user, field) for field in ROLE_FIELDS}
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
+
+def get_jwt_strategy() -> CachedJWTStrategy:
+    return CachedJWTStrategy(secret=SECRET, lifetime_seconds=3600, role_claims=JWT_ROLE_CLAIMS)
 
 
 auth_backend = AuthenticationBackend(
@@ -26,3 +88,15 @@ fastapi_users = FastAPIUsers[User, int](
 )
 
 current_user = fastapi_users.current_user()
+
+
+async def current_user_claims(token: Optional[str] = Depends(cookie_transport.scheme),
+                              user_manager=Depends(get_user_manager)) -> User:
+    # For permission checks that only need id and roles: trusts the token claims when they are there
+    strategy = get_jwt_strategy()
+    user = strategy.read_claims(token) if strategy.role_claims else None
+    if user is None:
+        user = await strategy.read_token(token, user_manager)
+    if user is None:
+        raise HTTPException(status_code=401)
+    return user
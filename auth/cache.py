@@ -0,0 +1,61 @@
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from fastapi_cache import FastAPICache
+from sqlalchemy.orm import make_transient_to_detached
+
+from auth.logger import auth_logger
+from auth.models import User
+from cache import namespace_key
+from config import AUTH_USER_CACHE_TTL
+
+USER_NAMESPACE = 'auth_user'
+
+# hashed_password is left out on purpose, it never has to leave the database
+USER_FIELDS = ('id', 'email', 'username', 'registered_at', 'is_active', 'is_superuser', 'is_verified', 'is_staff',
+               'is_seller')
+ROLE_FIELDS = ('is_active', 'is_superuser', 'is_verified', 'is_staff', 'is_seller')
+
+
+def build_user(fields: dict) -> User:
+    # Marked as an already persisted row, so session.add() in UserManager.update issues an UPDATE.
+    # Columns missing from fields stay unloaded
+    user = User(**fields)
+    make_transient_to_detached(user)
+    return user
+
+
+def dump_user(user: User) -> bytes:
+    return orjson.dumps({field: getattr(user, field) for field in USER_FIELDS})
+
+
+def load_user(value: bytes) -> User:
+    fields = orjson.loads(value)
+    if fields.get('registered_at'):
+        fields['registered_at'] = datetime.fromisoformat(fields['registered_at'])
+    return build_user(fields)
+
+
+async def get_cached_user(user_id: int) -> Optional[User]:
+    try:
+        value = await FastAPICache.get_backend().get(namespace_key(USER_NAMESPACE, user_id))
+    except Exception:
+        auth_logger.error(f'Some get_cached_user error for user {user_id}')
+        return None
+    return load_user(value) if value is not None else None
+
+
+async def cache_user(user: User) -> None:
+    try:
+        await FastAPICache.get_backend().set(namespace_key(USER_NAMESPACE, user.id), dump_user(user),
+                                             AUTH_USER_CACHE_TTL)
+    except Exception:
+        auth_logger.error(f'Some cache_user error for user {user.id}')
+
+
+async def invalidate_user(user_id: int) -> None:
+    try:
+        await FastAPICache.get_backend().clear(key=namespace_key(USER_NAMESPACE, user_id))
+    except Exception:
+        auth_logger.error(f'Some invalidate_user error for user {user_id}')
@@ -1,8 +1,5 @@
 import logging
 
-auth_handler = logging.FileHandler('logs/auth.log')
-auth_formatter = logging.Formatter('%(levelname)s:%(name)s-%(asctime)s-%(message)s')
-auth_handler.setFormatter(auth_formatter)
+from logger import setup_logger
 
-auth_logger = logging.Logger(name='auth_logger', level=logging.INFO)
-auth_logger.addHandler(auth_handler)
+auth_logger = setup_logger('auth_logger', 'auth', level=logging.INFO)
@@ -1,12 +1,14 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from fastapi import Depends, Request
 from fastapi_users import BaseUserManager, schemas, models, exceptions, IntegerIDMixin
 
+from auth.cache import invalidate_user
 from auth.logger import auth_logger
 from auth.models import User
+from auth.outbox import add_email
 from auth.utils import get_user_db
-from tasks.celery_app import send_email
+from tasks.celery_app import EMAIL_VERIFY, EMAIL_RESET_PASSWORD
 
 from config import SECRET
 
@@ -51,13 +53,26 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
             self, user: User, token: str, request: Optional[Request] = None
     ):
         auth_logger.info(f"Verification requested for user {user.id}")
-        send_email.delay(user.email, token)
+        await add_email(self.user_db.session, user.email, token, EMAIL_VERIFY)
 
     async def on_after_forgot_password(
             self, user: User, token: str, request: Optional[Request] = None
     ):
         auth_logger.info(f"User {user.id} has forgot their password")
-        send_email.delay(user.email, token)
+        await add_email(self.user_db.session, user.email, token, EMAIL_RESET_PASSWORD)
+
+    async def on_after_update(self, user: User, update_dict: Dict[str, Any], request: Optional[Request] = None):
+        await invalidate_user(user.id)
+
+    async def on_after_verify(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(user.id)
+
+    async def on_after_reset_password(self, user: User, request: Optional[Request] = None):
+        auth_logger.info(f"User {user.id} has reset their password")
+        await invalidate_user(user.id)
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(user.id)
 
 
 async def get_user_manager(user_db=Depends(get_user_db)):
@@ -43,3 +43,15 @@ class User(SQLAlchemyBaseUserTable[int], Base):
     is_seller: Mapped[bool] = mapped_column(
         Boolean, default=False, nullable=False
     )
+
+
+class EmailOutbox(Base):
+    # Emails waiting for the relay, written in the same transaction as the change that asks for them
+    __tablename__ = 'email_outbox'
+    metadata = metadata
+
+    id = Column(Integer, primary_key=True)
+    email = Column(String, nullable=False)
+    token = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,52 @@
+import asyncio
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.logger import auth_logger
+from auth.models import EmailOutbox
+from config import OUTBOX_BATCH_SIZE, OUTBOX_RELAY_INTERVAL
+from database import async_session_maker
+from tasks.celery_app import send_emails
+
+# Set when this process writes to the outbox, so the relay does not wait for its next poll
+outbox_wakeup = asyncio.Event()
+
+
+async def add_email(session: AsyncSession, email: str, token: str, kind: str) -> None:
+    # Only the database is touched here, a broker outage delays the email but never fails the request
+    await session.execute(insert(EmailOutbox).values(email=email, token=token, kind=kind))
+    await session.commit()
+    outbox_wakeup.set()
+
+
+async def relay_batch(session: AsyncSession) -> int:
+    # SKIP LOCKED lets the relays of all workers drain the outbox side by side
+    stmt = (select(EmailOutbox.id, EmailOutbox.email, EmailOutbox.token, EmailOutbox.kind)
+            .order_by(EmailOutbox.id).limit(OUTBOX_BATCH_SIZE).with_for_update(skip_locked=True))
+    rows = (await session.execute(stmt)).all()
+    if not rows:
+        return 0
+    # Publishing is blocking network I/O, it is kept off the event loop.
+    # A crash before the commit sends the batch again, emails are delivered at least once
+    await asyncio.to_thread(send_emails.delay, [[row.email, row.token, row.kind] for row in rows])
+    await session.execute(delete(EmailOutbox).where(EmailOutbox.id.in_([row.id for row in rows])))
+    await session.commit()
+    return len(rows)
+
+
+async def relay_outbox() -> None:
+    while True:
+        outbox_wakeup.clear()
+        try:
+            async with async_session_maker() as session:
+                while await relay_batch(session) == OUTBOX_BATCH_SIZE:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            auth_logger.error('Some relay_outbox error')
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), OUTBOX_RELAY_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from fastapi_cache import FastAPICache
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from benchmarks.seed import seed
+from database import async_session_maker, engine
+from main import app, lifespan
+from products.cache import PRODUCT_NAMESPACE
+from products.models import Product
+
+
+async def individual(client: AsyncClient, product_ids: list[int]) -> None:
+    # What a cart page does today, one request per item, fired concurrently like a browser would
+    responses = await asyncio.gather(*[client.get(f'/products/{product_id}') for product_id in product_ids])
+    assert all(response.status_code == 200 for response in responses)
+
+
+async def batch(client: AsyncClient, product_ids: list[int]) -> None:
+    response = await client.get('/products/batch', params={'ids': ','.join(map(str, product_ids))})
+    assert response.status_code == 200 and not response.json()['missing']
+
+
+async def measure(client: AsyncClient, load, carts: list[list[int]], cold: bool) -> list[float]:
+    timings = []
+    for product_ids in carts:
+        if cold:
+            await FastAPICache.clear(namespace=PRODUCT_NAMESPACE)
+        started = time.perf_counter()
+        await load(client, product_ids)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def main(products: int, cart_size: int, rounds: int) -> None:
+    await seed(products)
+    async with async_session_maker() as session:
+        all_ids = list((await session.scalars(select(Product.id).limit(10_000))).all())
+    rng = random.Random(0)
+    carts = [rng.sample(all_ids, cart_size) for _ in range(rounds)]
+
+    async with lifespan(app), AsyncClient(transport=ASGITransport(app=app), base_url='http://benchmark') as client:
+        for cold in (True, False):
+            if not cold:
+                # Warm every entry the carts use
+                await measure(client, batch, carts, cold=False)
+            for name, load in (('individual', individual), ('batch', batch)):
+                timings = sorted(await measure(client, load, carts, cold))
+                print(f'{"cold" if cold else "warm"} {name:10} cart={cart_size} '
+                      f'p50={statistics.median(timings) * 1000:7.1f}ms '
+                      f'p95={timings[int(0.95 * (len(timings) - 1))] * 1000:7.1f}ms '
+                      f'carts/s={len(timings) / sum(timings):7.1f}')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--cart-size', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.cart_size, args.rounds))
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.seed import seed_categories
+from database import async_session_maker, engine
+from products.bulk import BulkImport, iter_ndjson
+from products.models import Product
+from products.schemas import ProductCreateUpdate
+
+
+def make_rows(count: int, category_ids: list[int]) -> list[dict]:
+    return [
+        {'title': f'bulk {i}', 'description': 'benchmark', 'price': i % 1000 + 1, 'quantity': i % 50,
+         'category_id': category_ids[i % len(category_ids)]}
+        for i in range(count)
+    ]
+
+
+async def single_inserts(rows: list[dict]) -> None:
+    # What add_product does per HTTP request
+    async with async_session_maker() as session:
+        for row in rows:
+            await session.execute(insert(Product).values(**ProductCreateUpdate(**row).dict()))
+            await session.commit()
+
+
+async def bulk_import(rows: list[dict]) -> None:
+    async def lines():
+        for row in rows:
+            yield json.dumps(row)
+
+    async with async_session_maker() as session:
+        await BulkImport(session, author_id=None, can_update_any=True).run(iter_ndjson(lines()))
+
+
+async def main(rows: int, single_rows: int) -> None:
+    async with async_session_maker() as session:
+        category_ids = await seed_categories(session, 20)
+        await session.commit()
+
+    for name, func, count in (('single insert', single_inserts, single_rows), ('bulk import', bulk_import, rows)):
+        data = make_rows(count, category_ids)
+        started = time.perf_counter()
+        await func(data)
+        elapsed = time.perf_counter() - started
+        print(f'{name:<14} rows={count:<7} {count / elapsed:10.0f} rows/s')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--single-rows', type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.single_rows))
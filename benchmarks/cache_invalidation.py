@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import types
+
+from fakeredis import aioredis as fake_aioredis
+from fastapi_cache import FastAPICache
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from auth.base_config import current_user_claims
+from benchmarks.seed import seed
+from cache import TaggedRedisBackend, TwoTierBackend, ORJsonCoder, request_key_builder, namespace_key
+from config import CACHE_L1_MAXSIZE, CACHE_L1_TTL
+from database import async_session_maker, engine
+from main import app
+from products.cache import PRODUCT_NAMESPACE, PRODUCTS_NAMESPACE
+from products.models import Product
+
+# Checks the write path evictions against an in-memory Redis, the database is the configured one.
+# Needs fakeredis[lua], which is not part of the service requirements
+STAFF = types.SimpleNamespace(id=0, is_superuser=False, is_staff=True)
+
+
+def check(name: str, passed: bool) -> None:
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    if not passed:
+        raise SystemExit(1)
+
+
+async def product_body(product_id: int, title: str) -> dict:
+    async with async_session_maker() as session:
+        product = (await session.execute(select(Product).where(Product.id == product_id))).scalar_one()
+    return {'title': title, 'description': product.description, 'price': product.price,
+            'category_id': product.category_id, 'quantity': product.quantity}
+
+
+async def main(products: int) -> None:
+    await seed(products)
+    async with async_session_maker() as session:
+        first_id, second_id = (await session.scalars(select(Product.id).order_by(Product.id).limit(2))).all()
+
+    redis = fake_aioredis.FakeRedis()
+    FastAPICache.init(TwoTierBackend(TaggedRedisBackend(redis), maxsize=CACHE_L1_MAXSIZE, ttl=CACHE_L1_TTL),
+                      prefix='fastapi-cache', coder=ORJsonCoder, key_builder=request_key_builder)
+    app.dependency_overrides[current_user_claims] = lambda: STAFF
+    products_tag = TaggedRedisBackend.tag(namespace_key(PRODUCTS_NAMESPACE, ''))
+    first_key = namespace_key(PRODUCT_NAMESPACE, first_id)
+    second_key = namespace_key(PRODUCT_NAMESPACE, second_id)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://check') as client:
+        # Namespace clear through the tag set
+        for page_size in (5, 10):
+            assert (await client.get('/products/', params={'page_size': page_size})).status_code == 200
+        list_keys = await redis.smembers(products_tag)
+        check('list pages are recorded in the namespace tag set', len(list_keys) == 2)
+        await FastAPICache.clear(namespace=PRODUCTS_NAMESPACE)
+        check('namespace clear deletes every tagged key and the tag set',
+              not await redis.exists(products_tag, *list_keys))
+
+        # Per id eviction
+        for product_id in (first_id, second_id):
+            assert (await client.get(f'/products/{product_id}')).status_code == 200
+        check('product detail is cached under its id', await redis.exists(first_key, second_key) == 2)
+        title = f'cache check {first_id}'
+        response = await client.put(f'/products/{first_id}', json=await product_body(first_id, title))
+        check('update succeeds', response.status_code == 200 and response.json()['status'] == 'success')
+        check('update evicts the product it changed', not await redis.exists(first_key))
+        check('update keeps other products cached', await redis.exists(second_key) == 1)
+
+        # The next read refills from the database
+        response = await client.get(f'/products/{first_id}')
+        check('read after update returns the new title', response.json()['data'][0]['title'] == title)
+        check('read after update is cached again', await redis.exists(first_key) == 1)
+
+        # A miss is not cached, a product created later under that id is not hidden by it
+        missing_id = second_id + products * 10
+        response = await client.get(f'/products/{missing_id}')
+        check('missing product is not cached', response.json()['data'] == []
+              and not await redis.exists(namespace_key(PRODUCT_NAMESPACE, missing_id)))
+
+    app.dependency_overrides.clear()
+    await redis.close()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.products))
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from redis import asyncio as aioredis
+
+from cache import TaggedRedisBackend, TwoTierBackend
+from config import REDIS_HOST, REDIS_PORT
+
+
+def percentile(timings: list[float], q: int) -> float:
+    return statistics.quantiles(timings, n=100)[q - 1]
+
+
+async def measure(backend, keys: list[str], requests: int) -> list[float]:
+    timings = []
+    for _ in range(requests):
+        key = random.choice(keys)
+        started = time.perf_counter()
+        await backend.get_with_ttl(key)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(hot_keys: int, requests: int) -> None:
+    redis = aioredis.from_url(f'redis://{REDIS_HOST}:{REDIS_PORT}')
+    redis_backend = TaggedRedisBackend(redis)
+    two_tier = TwoTierBackend(redis_backend, maxsize=max(hot_keys, 1), ttl=60)
+    payload = json.dumps({'status': 'success', 'data': [{'Product': {'id': 1, 'title': 'x' * 200}}]})
+    keys = [f'fastapi-cache:benchmark:{i}' for i in range(hot_keys)]
+    for key in keys:
+        await redis_backend.set(key, payload, 600)
+
+    for name, backend in (('redis', redis_backend), ('l1+redis', two_tier)):
+        timings = await measure(backend, keys, requests)
+        print(f'{name:<9} p50={percentile(timings, 50):.3f}ms p99={percentile(timings, 99):.3f}ms')
+    print(two_tier.stats())
+
+    await redis_backend.clear(namespace='fastapi-cache:benchmark')
+    await redis.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hot-keys', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.hot_keys, args.requests))
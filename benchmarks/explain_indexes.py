@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from benchmarks.seed import seed
+from database import async_session_maker, engine
+from products.filters import ProductFilter
+from products.models import Product, PRODUCT_COLUMNS
+from products.pagination import add_tiebreaker
+
+INDEX_NODES = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def build_query(filters: dict, order_by):
+    # Same shape as get_many_products builds for a first page
+    product_filter = ProductFilter(**filters, order_by=order_by)
+    query = product_filter.filter(select(*PRODUCT_COLUMNS).limit(10))
+    query = product_filter.sort(query)
+    return add_tiebreaker(query, Product, product_filter.order_by)
+
+
+async def explain(session, query) -> dict:
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    plan = await session.scalar(text(f'EXPLAIN (FORMAT JSON) {compiled}'))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def uses_index(plan: dict) -> tuple[bool, list[str]]:
+    nodes = {node['Node Type'] for node in plan_nodes(plan)}
+    return bool(nodes & INDEX_NODES) and 'Seq Scan' not in nodes, sorted(nodes)
+
+
+async def main(products: int) -> int:
+    await seed(products)
+    failed = 0
+    async with async_session_maker() as session:
+        sample = await session.scalar(select(Product).limit(1))
+        number = sample.title.rsplit(' ', 1)[-1]
+        cases = [
+            ({}, None),
+            ({}, ['price']),
+            ({}, ['-price']),
+            ({}, ['title']),
+            ({'title': sample.title}, None),
+            ({'title': sample.title}, ['price']),
+            ({'price': sample.price}, None),
+            ({'price': sample.price}, ['title']),
+            ({'title': sample.title, 'price': sample.price}, None),
+            ({'price__gte': sample.price, 'price__lte': sample.price + 100}, None),
+            ({'price__gte': sample.price, 'price__lte': sample.price + 100}, ['price']),
+            ({'category_id__in': [sample.category_id]}, None),
+            ({'category_id__in': [sample.category_id]}, ['price']),
+            ({'category_id__in': [sample.category_id], 'price__lte': 100}, ['-price']),
+            ({'quantity__gt': 0, 'price__gte': sample.price, 'price__lte': sample.price + 100}, ['price']),
+            ({'author_id': -1}, None),
+            ({'title__ilike': f'%{number}%'}, None),
+        ]
+        for filters, order_by in cases:
+            ok, nodes = uses_index(await explain(session, build_query(filters, order_by)))
+            failed += not ok
+            print(f'{"ok  " if ok else "FAIL"} filters={list(filters)} order_by={order_by} nodes={nodes}')
+    await engine.dispose()
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=100_000)
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(main(args.products)) else 0)
@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import resource
+import time
+
+from benchmarks.seed import seed
+from database import engine
+from products.export import iter_export
+from products.filters import ProductFilter
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+async def main(products: int, export_format: str) -> None:
+    await seed(products)
+    started = time.perf_counter()
+    start_rss = peak_rss = rss_mb()
+    exported_bytes = chunks = 0
+    async for chunk in iter_export(ProductFilter(), None, export_format):
+        exported_bytes += len(chunk)
+        chunks += 1
+        if chunks % 50 == 0:
+            peak_rss = max(peak_rss, rss_mb())
+    elapsed = time.perf_counter() - started
+    print(f'format={export_format} bytes={exported_bytes} seconds={elapsed:.1f} '
+          f'rss_start={start_rss:.1f}MB rss_peak={peak_rss:.1f}MB rss_end={rss_mb():.1f}MB')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.format))
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Optional
+
+import httpx
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from auth.models import User
+from benchmarks.seed import seed, seed_products, seed_users, USER_PASSWORD
+from database import async_session_maker, engine
+from main import app, lifespan
+from products.models import Product, Category
+
+COOKIE_NAME = 'fastapiusersauth'
+SAMPLE_SIZE = 10_000
+PRODUCTS_PER_SELLER = 20
+
+# Scenario weights of each mix
+MIXES = {
+    'browse': {'browse': 50, 'filter': 25, 'detail': 25},
+    'mixed': {'browse': 35, 'filter': 20, 'detail': 30, 'login': 5, 'seller_write': 10},
+    'write': {'detail': 30, 'login': 10, 'seller_write': 60},
+}
+
+
+@dataclass
+class Fixtures:
+    product_ids: list[int]
+    category_ids: list[int]
+    emails: list[str]
+    # (auth cookie, ids of the seller's own products)
+    sellers: list[tuple[str, list[int]]] = field(default_factory=list)
+
+
+async def browse(client: AsyncClient, fixtures: Fixtures, rng: random.Random) -> httpx.Response:
+    return await client.get('/products/', params={'page': rng.randint(1, 20), 'page_size': 20})
+
+
+async def filter_products(client: AsyncClient, fixtures: Fixtures, rng: random.Random) -> httpx.Response:
+    low = rng.randint(1, 90_000)
+    category_ids = rng.sample(fixtures.category_ids, k=min(3, len(fixtures.category_ids)))
+    return await client.get('/products/', params={
+        'price__gte': low,
+        'price__lte': low + 10_000,
+        'category_id__in': ','.join(map(str, category_ids)),
+        'order_by': '-price',
+        'page_size': 20,
+    })
+
+
+async def detail(client: AsyncClient, fixtures: Fixtures, rng: random.Random) -> httpx.Response:
+    return await client.get(f'/products/{rng.choice(fixtures.product_ids)}')
+
+
+async def login(client: AsyncClient, fixtures: Fixtures, rng: random.Random) -> httpx.Response:
+    return await client.post('/auth/jwt/login', data={'username': rng.choice(fixtures.emails),
+                                                      'password': USER_PASSWORD})
+
+
+async def seller_write(client: AsyncClient, fixtures: Fixtures, rng: random.Random) -> httpx.Response:
+    cookie, product_ids = rng.choice(fixtures.sellers)
+    # Sent by hand: the auth cookie is Secure and would not go over plain http
+    return await client.put(f'/products/{rng.choice(product_ids)}', headers={'Cookie': f'{COOKIE_NAME}={cookie}'},
+                            json={
+                                'title': f'load test {rng.randint(1, 1_000_000)}',
+                                'price': rng.randint(1, 100_000),
+                                'category_id': rng.choice(fixtures.category_ids),
+                                'quantity': rng.randint(0, 500),
+                            })
+
+
+SCENARIOS = {
+    'browse': browse,
+    'filter': filter_products,
+    'detail': detail,
+    'login': login,
+    'seller_write': seller_write,
+}
+
+
+async def prepare(products: int, categories: int, users: int, sellers: int) -> tuple[Fixtures, dict[str, list[int]]]:
+    await seed(products, categories, users, sellers)
+    async with async_session_maker() as session:
+        seller_ids = await seed_users(session, sellers, seller=True)
+        owned = (await session.execute(select(Product.id, Product.author_id)
+                                       .where(Product.author_id.in_(seller_ids)))).all()
+        category_ids = list((await session.scalars(select(Category.id))).all())
+        if seller_ids and not owned:
+            await seed_products(session, PRODUCTS_PER_SELLER * len(seller_ids), category_ids, seller_ids)
+            owned = (await session.execute(select(Product.id, Product.author_id)
+                                           .where(Product.author_id.in_(seller_ids)))).all()
+        product_ids = list((await session.scalars(select(Product.id).order_by(Product.id).limit(SAMPLE_SIZE))).all())
+        result = await session.execute(select(User.id, User.email).where(User.email.like('bench-%')))
+        accounts = result.all()
+        await session.commit()
+
+    owned_by_seller = defaultdict(list)
+    for product_id, author_id in owned:
+        owned_by_seller[author_id].append(product_id)
+    fixtures = Fixtures(product_ids, category_ids, [email for _, email in accounts])
+    return fixtures, {email: owned_by_seller[user_id] for user_id, email in accounts if user_id in seller_ids}
+
+
+async def log_in_sellers(client: AsyncClient, fixtures: Fixtures, owned: dict[str, list[int]]) -> None:
+    for email, product_ids in owned.items():
+        if not product_ids:
+            continue
+        response = await client.post('/auth/jwt/login', data={'username': email, 'password': USER_PASSWORD})
+        if COOKIE_NAME in response.cookies:
+            fixtures.sellers.append((response.cookies[COOKIE_NAME], product_ids))
+
+
+async def worker(new_client: Callable[[], AsyncClient], fixtures: Fixtures, mix: dict[str, int], deadline: float,
+                 samples: Optional[dict], rng: random.Random) -> None:
+    names, weights = zip(*mix.items())
+    # A cookie jar per simulated user: a shared last_write cookie would send every read after the first write
+    # to the primary, and the replica reads would never be measured
+    async with new_client() as client:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, fixtures, rng)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if samples is not None:
+                samples[name].append((time.perf_counter() - started, ok))
+
+
+async def run_phase(new_client: Callable[[], AsyncClient], fixtures: Fixtures, mix: dict[str, int], concurrency: int, duration: float,
+                    samples: Optional[dict], seed_value: int) -> float:
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[
+        worker(new_client, fixtures, mix, deadline, samples, random.Random(seed_value + i)) for i in range(concurrency)
+    ])
+    return time.perf_counter() - started
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    return latencies[min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))]
+
+
+def summarize(samples: list[tuple[float, bool]], elapsed: float) -> dict:
+    latencies = sorted(latency for latency, _ in samples)
+    if not latencies:
+        return {'requests': 0, 'errors': 0, 'rps': 0.0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def main(args) -> None:
+    mix = dict(MIXES[args.mix])
+    fixtures, owned = await prepare(args.products, args.categories, args.users, args.sellers)
+
+    if args.base_url:
+        new_client = partial(AsyncClient, base_url=args.base_url, timeout=args.timeout)
+        app_context = nullcontext()
+    else:
+        # In-process: the app runs in this event loop against the configured Postgres and Redis
+        new_client = partial(AsyncClient, transport=ASGITransport(app=app), base_url='http://benchmark',
+                             timeout=args.timeout)
+        app_context = lifespan(app)
+
+    async with app_context:
+        async with new_client() as client:
+            await log_in_sellers(client, fixtures, owned)
+        if not fixtures.sellers:
+            mix.pop('seller_write', None)
+        if not fixtures.emails:
+            mix.pop('login', None)
+        await run_phase(new_client, fixtures, mix, args.concurrency, args.warmup, None, args.seed)
+        samples = defaultdict(list)
+        elapsed = await run_phase(new_client, fixtures, mix, args.concurrency, args.duration, samples, args.seed)
+
+    results = {
+        'mix': args.mix,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'total': summarize([sample for items in samples.values() for sample in items], elapsed),
+        'scenarios': {name: summarize(items, elapsed) for name, items in sorted(samples.items())},
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    print(output)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', help='e.g. http://localhost:10000 for docker-compose, in-process when omitted')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--sellers', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    asyncio.run(main(args))
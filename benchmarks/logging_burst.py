@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from logger import setup_logger, stop_listeners
+
+HEARTBEAT_INTERVAL = 0.001
+
+
+def slow_down_disk(latency: float) -> None:
+    # Every flush of a file handler stands in for a write to a slow or busy disk
+    flush = logging.StreamHandler.flush
+
+    def slow_flush(self):
+        time.sleep(latency)
+        flush(self)
+
+    logging.StreamHandler.flush = slow_flush
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(time.perf_counter() - started - HEARTBEAT_INTERVAL)
+
+
+async def burst(logger: logging.Logger, errors: int) -> float:
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    for i in range(errors):
+        try:
+            raise ValueError(i)
+        except ValueError:
+            logger.error('Some burst error', exc_info=True)
+        if i % 10 == 0:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    print(f'{logger.name:<8} errors={errors:<6} burst={elapsed * 1000:9.1f}ms max_loop_lag={max(lags) * 1000:8.1f}ms')
+    return max(lags)
+
+
+async def main(errors: int, disk_latency_ms: float) -> None:
+    slow_down_disk(disk_latency_ms / 1000)
+    with tempfile.TemporaryDirectory() as directory:
+        direct = logging.Logger('direct')
+        direct.addHandler(logging.FileHandler(f'{directory}/direct.log'))
+        await burst(direct, errors)
+
+        queued_lag = await burst(setup_logger('queued', 'queued', directory=directory), errors)
+        stop_listeners()
+
+    # One slow write on the loop would already show up as a lag of disk_latency_ms
+    if queued_lag * 1000 >= disk_latency_ms:
+        raise SystemExit(f'Event loop blocked for {queued_lag * 1000:.1f}ms with the queue handler')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--errors', type=int, default=500)
+    parser.add_argument('--disk-latency-ms', type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.errors, args.disk_latency_ms))
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import event, select, update, delete, func
+
+from benchmarks.seed import seed
+from database import async_session_maker, engine
+from products.models import Product
+
+
+class RoundTrips:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine.sync_engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def update_select_first(session, product_id: int) -> None:
+    result = await session.execute(select(Product).where(Product.id == product_id))
+    if result.mappings().first():
+        await session.execute(update(Product).where(Product.id == product_id).values(quantity=Product.quantity + 1))
+        await session.commit()
+
+
+async def update_returning(session, product_id: int) -> None:
+    stmt = update(Product).where(Product.id == product_id).values(quantity=Product.quantity + 1).returning(Product.id)
+    result = await session.execute(stmt)
+    if result.scalar_one_or_none() is not None:
+        await session.commit()
+
+
+async def delete_select_first(session, product_id: int) -> None:
+    result = await session.execute(select(Product).where(Product.id == product_id))
+    if result.mappings().first():
+        await session.execute(delete(Product).where(Product.id == product_id))
+        await session.commit()
+
+
+async def delete_returning(session, product_id: int) -> None:
+    result = await session.execute(delete(Product).where(Product.id == product_id).returning(Product.id))
+    if result.scalar_one_or_none() is not None:
+        await session.commit()
+
+
+async def measure(round_trips: RoundTrips, operation, product_ids: list[int]) -> tuple[float, float]:
+    timings = []
+    round_trips.count = 0
+    for product_id in product_ids:
+        async with async_session_maker() as session:
+            started = time.perf_counter()
+            await operation(session, product_id)
+            timings.append((time.perf_counter() - started) * 1000)
+    return round_trips.count / len(product_ids), statistics.median(timings)
+
+
+async def main(products: int, operations: int) -> None:
+    await seed(products)
+    async with async_session_maker() as session:
+        product_ids = list((await session.scalars(select(Product.id).order_by(Product.id).limit(operations * 2))).all())
+        max_id = await session.scalar(select(func.max(Product.id)))
+    if len(product_ids) < operations * 2:
+        raise SystemExit(f'Need at least {operations * 2} products, run with a larger --products')
+
+    round_trips = RoundTrips()
+    missing_ids = [max_id + i for i in range(1, operations + 1)]
+    cases = (
+        ('update', update_select_first, update_returning, product_ids[:operations]),
+        ('update missing', update_select_first, update_returning, missing_ids),
+        # Each variant deletes its own half, a deleted row would turn the other into the missing case
+        ('delete', delete_select_first, None, product_ids[:operations]),
+        ('delete', None, delete_returning, product_ids[operations:]),
+    )
+    for name, select_first, returning, ids in cases:
+        if select_first is not None:
+            per_op, median_ms = await measure(round_trips, select_first, ids)
+            print(f'{name:<15} select+write statements/op={per_op:4.1f} median={median_ms:7.2f}ms')
+        if returning is not None:
+            per_op, median_ms = await measure(round_trips, returning, ids)
+            print(f'{name:<15} returning    statements/op={per_op:4.1f} median={median_ms:7.2f}ms')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--operations', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.operations))
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select
+
+from benchmarks.seed import seed
+from database import async_session_maker, engine
+from products.models import Product, PRODUCT_COLUMNS
+from products.pagination import get_sort_keys, get_sort_types, encode_cursor, decode_cursor, apply_cursor
+
+PAGES = (1, 100, 10_000)
+PAGE_SIZE = 10
+# A keyset page deep in the list may cost this many times the first page before it counts as not flat
+FLAT_FACTOR = 3
+
+
+def ordered(query, order_by):
+    for field_name, desc in get_sort_keys(order_by):
+        column = getattr(Product, field_name)
+        query = query.order_by(column.desc() if desc else column.asc())
+    return query
+
+
+async def measure(session, query, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await session.execute(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def run(order_by, repeats: int) -> dict[int, float]:
+    # Keyset latency per page
+    sort_keys = get_sort_keys(order_by)
+    keyset_timings = {}
+    async with async_session_maker() as session:
+        for page in PAGES:
+            offset_query = ordered(select(*PRODUCT_COLUMNS).limit(PAGE_SIZE).offset(page * PAGE_SIZE), order_by)
+
+            # The cursor a client would hold after walking to this page
+            previous = await session.execute(
+                ordered(select(*PRODUCT_COLUMNS).offset(page * PAGE_SIZE - 1).limit(1), order_by)
+            )
+            cursor = encode_cursor(previous.mappings().one(), sort_keys)
+            keyset_query = apply_cursor(select(*PRODUCT_COLUMNS).limit(PAGE_SIZE), Product, sort_keys,
+                                        decode_cursor(cursor, sort_keys, get_sort_types(Product, sort_keys)))
+            keyset_query = ordered(keyset_query, order_by)
+
+            offset_ms = await measure(session, offset_query, repeats)
+            keyset_ms = await measure(session, keyset_query, repeats)
+            keyset_timings[page] = keyset_ms
+            print(f'order_by={",".join(order_by or ["id"]):<10} page={page:<6} '
+                  f'offset={offset_ms:8.2f}ms keyset={keyset_ms:8.2f}ms '
+                  f'keyset_vs_first={keyset_ms / keyset_timings[PAGES[0]]:5.2f}x')
+    return keyset_timings
+
+
+async def main(products: int, repeats: int) -> None:
+    await seed(products)
+    for order_by in (None, ['-price'], ['title'], ['-updated_at']):
+        keyset_timings = await run(order_by, repeats)
+        if order_by == ['-price'] and keyset_timings[max(PAGES)] > FLAT_FACTOR * keyset_timings[PAGES[0]]:
+            # The (price, id) row comparison should make the deepest page cost about as much as the first
+            raise SystemExit(f'-price keyset page {max(PAGES)} took {keyset_timings[max(PAGES)]:.2f}ms, '
+                             f'{keyset_timings[max(PAGES)] / keyset_timings[PAGES[0]]:.1f}x the first page')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=(max(PAGES) + 1) * PAGE_SIZE)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.repeats))
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from redis import asyncio as aioredis
+from sqlalchemy import insert, select, delete, func
+
+from benchmarks.seed import seed_categories, seed_users
+from config import REDIS_HOST, REDIS_PORT
+from database import async_session_maker, engine
+from orders.inventory import reserve, stock_counters, STOCK_KEY_PREFIX
+from orders.models import Reservation, RESERVATION_ACTIVE
+from products.models import Product
+
+
+async def buyer(user_id: int, product_id: int, timings: list[float]) -> bool:
+    started = time.perf_counter()
+    async with async_session_maker() as session:
+        reservation = await reserve(session, user_id, product_id, 1)
+    timings.append(time.perf_counter() - started)
+    return reservation is not None
+
+
+async def main(buyers: int, stock: int, use_redis: bool) -> None:
+    # reserve() evicts cached product entries, nothing is cached here
+    FastAPICache.init(InMemoryBackend())
+    async with async_session_maker() as session:
+        category_ids = await seed_categories(session, 1)
+        user_id = (await seed_users(session, 1))[0]
+        product_id = await session.scalar(insert(Product).values(
+            title='flash sale', price=1, quantity=stock, category_id=category_ids[0],
+        ).returning(Product.id))
+        await session.commit()
+
+    redis = None
+    if use_redis:
+        redis = aioredis.from_url(f'redis://{REDIS_HOST}:{REDIS_PORT}')
+        stock_counters.product_ids.add(product_id)
+        stock_counters.bind(redis)
+
+    timings = []
+    started = time.perf_counter()
+    results = await asyncio.gather(*[buyer(user_id, product_id, timings) for _ in range(buyers)])
+    elapsed = time.perf_counter() - started
+
+    async with async_session_maker() as session:
+        left = await session.scalar(select(Product.quantity).where(Product.id == product_id))
+        reserved = await session.scalar(select(func.coalesce(func.sum(Reservation.quantity), 0)).where(
+            Reservation.product_id == product_id, Reservation.status == RESERVATION_ACTIVE))
+        # Reservations go with the product through the cascade
+        await session.execute(delete(Product).where(Product.id == product_id))
+        await session.commit()
+    if redis is not None:
+        await redis.delete(f'{STOCK_KEY_PREFIX}{product_id}')
+        await redis.close()
+
+    timings.sort()
+    print(f'buyers={buyers} stock={stock} redis={use_redis} succeeded={sum(results)} left={left} '
+          f'reserved={reserved} oversold={max(0, reserved - stock)} '
+          f'throughput={buyers / elapsed:8.1f} attempts/s p50={statistics.median(timings) * 1000:7.1f}ms '
+          f'p99={timings[int(0.99 * (len(timings) - 1))] * 1000:7.1f}ms')
+    await engine.dispose()
+    if reserved + left != stock or reserved > stock:
+        raise SystemExit('Stock does not add up')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buyers', type=int, default=1_000)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--redis', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(main(args.buyers, args.stock, args.redis))
@@ -0,0 +1,34 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.seed import seed, WORDS
+from database import async_session_maker, engine
+from products.search import normalize_query, build_search_query
+
+QUERIES = (WORDS[0], f'{WORDS[1]} {WORDS[2]}', WORDS[3][:3], f'{WORDS[4]} {WORDS[5][:2]}', '12345')
+
+
+async def main(products: int, repeats: int, limit: int) -> None:
+    await seed(products)
+    async with async_session_maker() as session:
+        for q in QUERIES:
+            query = build_search_query(normalize_query(q), limit)
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                await session.execute(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            quantiles = statistics.quantiles(timings, n=100)
+            print(f'q={q!r:<20} p50={quantiles[49]:8.2f}ms p99={quantiles[98]:8.2f}ms')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.repeats, args.limit))
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import random
+
+from fastapi_users.password import PasswordHelper
+from sqlalchemy import select, func, insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from auth.models import User
+from database import async_session_maker
+from products.models import Product, Category
+
+BATCH_SIZE = 5000
+USER_PASSWORD = 'bench-password'
+WORDS = ['phone', 'case', 'cable', 'laptop', 'mouse', 'keyboard', 'monitor', 'lamp', 'chair', 'desk',
+         'book', 'pen', 'bag', 'watch', 'camera', 'speaker', 'charger', 'router', 'tablet', 'headphones']
+
+
+async def seed_categories(session, count: int) -> list[int]:
+    stmt = pg_insert(Category).values([{'title': f'bench-category-{i}'} for i in range(count)])
+    await session.execute(stmt.on_conflict_do_nothing(index_elements=['title']))
+    result = await session.execute(select(Category.id).where(Category.title.like('bench-category-%')))
+    return list(result.scalars().all())
+
+
+async def seed_products(session, count: int, category_ids: list[int], author_ids: list[int] = None) -> None:
+    for start in range(0, count, BATCH_SIZE):
+        rows = []
+        for i in range(start, min(start + BATCH_SIZE, count)):
+            rows.append({
+                'title': f'{random.choice(WORDS)} {random.choice(WORDS)} {i}',
+                'description': f'{random.choice(WORDS)} {random.choice(WORDS)} {random.choice(WORDS)}',
+                'price': random.randint(1, 100_000),
+                'quantity': random.randint(0, 500),
+                'category_id': random.choice(category_ids),
+                'author_id': random.choice(author_ids) if author_ids else None,
+            })
+        await session.execute(insert(Product), rows)
+        await session.commit()
+
+
+def user_email(i: int, seller: bool) -> str:
+    return f"bench-{'seller' if seller else 'user'}-{i}@example.com"
+
+
+async def seed_users(session, count: int, seller: bool = False) -> list[int]:
+    # All users share USER_PASSWORD, hashing it once keeps seeding fast
+    if not count:
+        return []
+    emails = [user_email(i, seller) for i in range(count)]
+    result = await session.execute(select(User.email).where(User.email.in_(emails)))
+    existing = set(result.scalars().all())
+    hashed_password = PasswordHelper().hash(USER_PASSWORD)
+    rows = [
+        {
+            'email': email,
+            'username': email.split('@')[0],
+            'hashed_password': hashed_password,
+            'is_active': True,
+            'is_verified': True,
+            'is_seller': seller,
+        }
+        for email in emails if email not in existing
+    ]
+    if rows:
+        await session.execute(insert(User), rows)
+    result = await session.execute(select(User.id).where(User.email.in_(emails)).order_by(User.id))
+    return list(result.scalars().all())
+
+
+async def seed(products: int, categories: int = 20, users: int = 0, sellers: int = 0) -> None:
+    # Tops the product table up to `products` rows so repeated runs reuse the data
+    async with async_session_maker() as session:
+        category_ids = await seed_categories(session, categories)
+        await seed_users(session, users)
+        await seed_users(session, sellers, seller=True)
+        await session.commit()
+        existing = await session.scalar(select(func.count()).select_from(Product))
+        if existing < products:
+            await seed_products(session, products - existing, category_ids)
+        await session.execute(text('ANALYZE product'))
+        await session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--users', type=int, default=0)
+    parser.add_argument('--sellers', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(seed(args.products, args.categories, args.users, args.sellers))
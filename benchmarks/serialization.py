@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from benchmarks.seed import seed
+from database import async_session_maker, engine
+from main import app, lifespan
+from products.models import Product, PRODUCT_COLUMNS
+from products.schemas import ProductListResponse
+
+PAGE_SIZE = 30
+
+
+async def legacy_pipeline(session) -> bytes:
+    # ORM entities wrapped in row mappings, jsonable_encoder and stdlib json
+    result = await session.execute(select(Product).limit(PAGE_SIZE))
+    content = {'status': 'success', 'data': result.mappings().all(), 'details': None, 'page': 0,
+               'page_size': PAGE_SIZE}
+    return json.dumps(jsonable_encoder(content)).encode()
+
+
+async def lean_pipeline(session) -> bytes:
+    result = await session.execute(select(*PRODUCT_COLUMNS).limit(PAGE_SIZE))
+    content = {'status': 'success', 'data': result.mappings().all(), 'details': None, 'page': 0,
+               'page_size': PAGE_SIZE}
+    return ProductListResponse.model_validate(content).model_dump_json().encode()
+
+
+async def measure_pipelines(iterations: int) -> None:
+    async with async_session_maker() as session:
+        for name, pipeline in (('legacy', legacy_pipeline), ('lean', lean_pipeline)):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                await pipeline(session)
+            print(f'pipeline {name:<7} {iterations / (time.perf_counter() - started):8.0f} pages/s')
+
+
+async def measure_endpoint(requests: int) -> None:
+    async with lifespan(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url='http://benchmark') as client:
+            # no-cache makes fastapi-cache skip the lookup so every request runs the handler
+            headers = {'Cache-Control': 'no-cache'}
+            started = time.perf_counter()
+            for _ in range(requests):
+                await client.get(f'/products/?page_size={PAGE_SIZE}', headers=headers)
+            print(f'GET /products/  {requests / (time.perf_counter() - started):8.0f} requests/s')
+
+
+async def main(iterations: int, requests: int) -> None:
+    await seed(1_000)
+    await measure_pipelines(iterations)
+    await measure_endpoint(requests)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2_000)
+    parser.add_argument('--requests', type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.requests))
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+
+from fastapi_cache import FastAPICache
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event, select
+
+from benchmarks.seed import seed
+from cache import namespace_key
+from database import async_session_maker, engine
+from main import app, lifespan
+from products.cache import PRODUCT_NAMESPACE
+from products.models import Product
+
+
+async def main(concurrency: int) -> None:
+    await seed(1_000)
+    async with async_session_maker() as session:
+        product_id = await session.scalar(select(Product.id).limit(1))
+
+    queries = 0
+
+    def count_query(*args):
+        nonlocal queries
+        queries += 1
+
+    async with lifespan(app):
+        # Simulates the entry expiring under load
+        await FastAPICache.get_backend().clear(key=namespace_key(PRODUCT_NAMESPACE, product_id))
+        event.listen(engine.sync_engine, 'before_cursor_execute', count_query)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url='http://benchmark') as client:
+            responses = await asyncio.gather(*[client.get(f'/products/{product_id}') for _ in range(concurrency)])
+        event.remove(engine.sync_engine, 'before_cursor_execute', count_query)
+
+    statuses = {response.status_code for response in responses}
+    print(f'requests={concurrency} statuses={sorted(statuses)} db_queries={queries}')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
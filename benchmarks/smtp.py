@@ -0,0 +1,61 @@
+import argparse
+import smtplib
+import time
+
+from aiosmtpd.controller import Controller
+
+from tasks.celery_app import get_email_template
+from tasks.smtp import SMTPPool
+
+HOST = '127.0.0.1'
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def per_message(port: int, messages: int) -> float:
+    # What send_email used to do: connect, send one message, quit
+    started = time.perf_counter()
+    for i in range(messages):
+        with smtplib.SMTP(HOST, port) as server:
+            server.send_message(get_email_template(f'user{i}@example.com', 'token'))
+    return time.perf_counter() - started
+
+
+def pooled(port: int, messages: int) -> float:
+    pool = SMTPPool(HOST, port, None, None, use_ssl=False)
+    started = time.perf_counter()
+    for i in range(messages):
+        pool.send(get_email_template(f'user{i}@example.com', 'token'))
+    pool.close()
+    return time.perf_counter() - started
+
+
+def main(messages: int, port: int) -> None:
+    handler = CountingHandler()
+    controller = Controller(handler, hostname=HOST, port=port)
+    controller.start()
+    try:
+        for name, run in (('per message', per_message), ('pooled', pooled)):
+            handler.received = 0
+            elapsed = run(port, messages)
+            print(f'{name:12} messages={messages} received={handler.received} '
+                  f'throughput={messages / elapsed:8.1f} messages/s')
+            if handler.received != messages:
+                raise SystemExit(f'{name}: {messages - handler.received} messages lost')
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1_000)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+    main(args.messages, args.port)
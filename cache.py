@@ -0,0 +1,472 @@
+import asyncio
+import hashlib
+import inspect
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends import Backend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import Coder
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from database import replica_router
+from logger import setup_logger
+from metrics import CACHE_HITS, CACHE_MISSES
+
+cache_logger = setup_logger('cache_logger', 'cache')
+
+TAG_SUFFIX = ':__keys__'
+INVALIDATION_CHANNEL = 'fastapi-cache:invalidate'
+
+CLEAR_TAG_SCRIPT = """
+local unpack = unpack or table.unpack
+local keys = redis.call('SMEMBERS', KEYS[1])
+for i = 1, #keys, 500 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 499, #keys)))
+end
+redis.call('DEL', KEYS[1])
+return #keys
+"""
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+# Key the @cache decorator above single_flight must not store: the fill stored it already, or it is not cacheable
+skip_store: ContextVar[Optional[str]] = ContextVar('skip_store', default=None)
+
+
+def _orjson_default(obj: Any) -> Any:
+    # Row mappings from column selects are the common case, anything else goes through FastAPI's encoder
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return jsonable_encoder(obj)
+
+
+class ORJsonCoder(Coder):
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, JSONResponse):
+            return value.body
+        return orjson.dumps(value, default=_orjson_default)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+
+class TaggedRedisBackend(RedisBackend):
+    # Every key is also recorded in a set per namespace, so a namespace is evicted without scanning KEYS
+
+    @staticmethod
+    def tag(key: str) -> str:
+        return key.rsplit(':', 1)[0] + TAG_SUFFIX
+
+    async def set(self, key: str, value: str, expire: Optional[int] = None) -> None:
+        tag = self.tag(key)
+        async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
+            pipe.set(key, value, ex=expire).sadd(tag, key)
+            if expire:
+                pipe.expire(tag, expire)
+            await pipe.execute()
+
+    async def get_many_with_ttl(self, keys: list[str]) -> list[Tuple[int, Optional[bytes]]]:
+        # One round trip: an MGET for the values and the TTLs alongside it
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            for key in keys:
+                pipe.ttl(key)
+            values, *ttls = await pipe.execute()
+        return list(zip(ttls, values))
+
+    async def set_many(self, items: dict[str, bytes], expire: Optional[int] = None) -> None:
+        async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ex=expire).sadd(self.tag(key), key)
+            if expire:
+                for tag in {self.tag(key) for key in items}:
+                    pipe.expire(tag, expire)
+            await pipe.execute()
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            return await self.redis.eval(CLEAR_TAG_SCRIPT, 1, namespace + TAG_SUFFIX)
+        return await super().clear(key=key)
+
+    async def acquire_lock(self, key: str, timeout: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if await self.redis.set(f'{key}:lock', token, nx=True, ex=timeout):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, f'{key}:lock', token)
+
+    async def is_locked(self, key: str) -> bool:
+        return bool(await self.redis.exists(f'{key}:lock'))
+
+
+def get_namespace(key: str) -> str:
+    # Keys are built as <prefix>:<namespace>:<identifier>
+    parts = key.split(':', 2)
+    return parts[1] if len(parts) == 3 else ''
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[bytes, float, float]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, source_expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value, source_expires_at
+
+    def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        now = time.monotonic()
+        source_expires_at = now + expire if expire and expire > 0 else float('inf')
+        self._entries[key] = (value, min(now + self.ttl, source_expires_at), source_expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TwoTierBackend(Backend):
+    # Per-worker LRU (L1) in front of Redis (L2). Evictions are published to every worker over pub/sub,
+    # a value that slips past an eviction is still bounded by the L1 TTL
+
+    def __init__(self, backend: RedisBackend, maxsize: int, ttl: int, on_invalidation: Optional[Callable] = None):
+        self.backend = backend
+        self.local = LRUCache(maxsize, ttl)
+        self.on_invalidation = on_invalidation
+        self.l1_hits = self.l1_misses = self.l2_hits = self.l2_misses = 0
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        namespace = get_namespace(key)
+        entry = self.local.get(key)
+        if entry is not None:
+            self.l1_hits += 1
+            CACHE_HITS.labels(namespace, 'l1').inc()
+            value, source_expires_at = entry
+            ttl = source_expires_at - time.monotonic()
+            return (int(ttl) if ttl != float('inf') else -1), value
+        self.l1_misses += 1
+        ttl, value = await self.backend.get_with_ttl(key)
+        if value is None:
+            self.l2_misses += 1
+            CACHE_MISSES.labels(namespace).inc()
+        else:
+            self.l2_hits += 1
+            CACHE_HITS.labels(namespace, 'l2').inc()
+            self.local.set(key, value, ttl)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        values = [None] * len(keys)
+        remote = []
+        for index, key in enumerate(keys):
+            entry = self.local.get(key)
+            if entry is not None:
+                self.l1_hits += 1
+                CACHE_HITS.labels(get_namespace(key), 'l1').inc()
+                values[index] = entry[0]
+            else:
+                self.l1_misses += 1
+                remote.append(index)
+        if remote:
+            entries = await self.backend.get_many_with_ttl([keys[index] for index in remote])
+            for index, (ttl, value) in zip(remote, entries):
+                if value is None:
+                    self.l2_misses += 1
+                    CACHE_MISSES.labels(get_namespace(keys[index])).inc()
+                else:
+                    self.l2_hits += 1
+                    CACHE_HITS.labels(get_namespace(keys[index]), 'l2').inc()
+                    self.local.set(keys[index], value, ttl)
+                    values[index] = value
+        return values
+
+    async def set(self, key: str, value: str, expire: Optional[int] = None) -> None:
+        if skip_store.get() == key:
+            skip_store.set(None)
+            return
+        await self.backend.set(key, value, expire)
+        self.local.set(key, value.encode() if isinstance(value, str) else value, expire)
+
+    async def set_many(self, items: dict[str, bytes], expire: Optional[int] = None) -> None:
+        await self.backend.set_many(items, expire)
+        for key, value in items.items():
+            self.local.set(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        result = await self.backend.clear(namespace, key)
+        if namespace:
+            message = f'namespace:{namespace}'
+        elif key:
+            message = f'key:{key}'
+        else:
+            return result
+        # Applied here right away, the other workers get it over pub/sub
+        self.apply_invalidation(message)
+        await self.backend.redis.publish(INVALIDATION_CHANNEL, message)
+        return result
+
+    async def acquire_lock(self, key: str, timeout: int) -> Optional[str]:
+        return await self.backend.acquire_lock(key, timeout)
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self.backend.release_lock(key, token)
+
+    async def is_locked(self, key: str) -> bool:
+        return await self.backend.is_locked(key)
+
+    def stats(self) -> dict:
+        return {
+            'l1_size': len(self.local),
+            'l1_hits': self.l1_hits,
+            'l1_misses': self.l1_misses,
+            'l2_hits': self.l2_hits,
+            'l2_misses': self.l2_misses,
+        }
+
+    def apply_invalidation(self, message: str) -> None:
+        if self.on_invalidation is not None:
+            self.on_invalidation(message)
+        kind, _, target = message.partition(':')
+        if kind == 'namespace':
+            self.local.delete_prefix(target + ':')
+        elif kind == 'key':
+            self.local.delete(target)
+
+    async def listen_invalidations(self) -> None:
+        while True:
+            try:
+                async with self.backend.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Anything published while we were not subscribed is lost, start from a clean L1
+                    self.local.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            data = message['data']
+                            self.apply_invalidation(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.local.clear()
+                await asyncio.sleep(1)
+
+
+def request_key_builder(
+    func: Callable,
+    namespace: Optional[str] = '',
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: Optional[tuple] = None,
+    kwargs: Optional[dict] = None,
+) -> str:
+    # Injected sessions repr with their memory address, leaving them in would make every key unique
+    kwargs = {name: value for name, value in (kwargs or {}).items() if not isinstance(value, AsyncSession)}
+    cache_key = hashlib.md5(f'{func.__module__}:{func.__name__}:{args}:{kwargs}'.encode()).hexdigest()
+    return f'{FastAPICache.get_prefix()}:{namespace}:{cache_key}'
+
+
+def namespace_key(namespace: str, identifier) -> str:
+    return f'{FastAPICache.get_prefix()}:{namespace}:{identifier}'
+
+
+def single_flight(namespace: str, expire: int, key_builder: Optional[Callable] = None,
+                  cacheable: Optional[Callable[[Any], bool]] = None):
+    # Goes under @cache, so it only runs on a miss. Concurrent misses for one key share a single call in this
+    # worker, and a Redis lock lets one worker in the fleet refill the entry while the others wait for it.
+    # Results cacheable() rejects are returned but not stored. The fill is a task of its own, so a request that goes away, the first one included, only stops waiting
+    in_flight: dict[str, asyncio.Task] = {}
+
+    def wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            builder = key_builder or FastAPICache.get_key_builder()
+            cache_key = builder(func, namespace, args=args, kwargs=kwargs)
+            if inspect.isawaitable(cache_key):
+                cache_key = await cache_key
+
+            task = in_flight.get(cache_key)
+            if task is None:
+                task = asyncio.create_task(_owned_fill(func, cache_key, expire, cacheable, args, kwargs))
+                in_flight[cache_key] = task
+                task.add_done_callback(lambda done: _fill_done(in_flight, cache_key, done))
+            result, skip = await asyncio.shield(task)
+            if skip:
+                skip_store.set(cache_key)
+            return result
+
+        return inner
+
+    return wrapper
+
+
+def _fill_done(in_flight: dict, cache_key: str, task: asyncio.Task) -> None:
+    if in_flight.get(cache_key) is task:
+        del in_flight[cache_key]
+    if not task.cancelled():
+        # Retrieved here, a failed fill nobody waits for any more is not logged as never retrieved
+        task.exception()
+
+
+async def _owned_fill(func, cache_key: str, expire: int, cacheable: Optional[Callable], args, kwargs):
+    # Outlives the request that started it, so it swaps the request's session, closed when that request ends,
+    # for a new one set up the same way
+    sessions = [value for value in kwargs.values() if isinstance(value, AsyncSession)]
+    if not sessions:
+        return await _fill(func, cache_key, expire, cacheable, args, kwargs)
+    template = sessions[0]
+    async with AsyncSession(template.bind, sync_session_class=template.sync_session_class,
+                            expire_on_commit=template.sync_session.expire_on_commit) as session:
+        kwargs = {name: session if isinstance(value, AsyncSession) else value for name, value in kwargs.items()}
+        return await _fill(func, cache_key, expire, cacheable, args, kwargs)
+
+
+async def _fill(func, cache_key: str, expire: int, cacheable: Optional[Callable], args,
+                kwargs) -> Tuple[Any, bool]:
+    # (result, whether the @cache decorator should skip storing it)
+    backend = FastAPICache.get_backend()
+    coder = FastAPICache.get_coder()
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            token = await backend.acquire_lock(cache_key, LOCK_TIMEOUT)
+        except Exception:
+            cache_logger.warning(f"Error locking cache key '{cache_key}'", exc_info=True)
+            break
+        if token is not None:
+            try:
+                with replica_router.refill([cache_key]):
+                    result = await func(*args, **kwargs)
+                if cacheable is not None and not cacheable(result):
+                    return result, True
+                try:
+                    # Stored before the lock is released so waiting workers find it
+                    await backend.set(cache_key, coder.encode(result), expire)
+                except Exception:
+                    cache_logger.warning(f"Error setting cache key '{cache_key}'", exc_info=True)
+                    return result, False
+                return result, True
+            finally:
+                await backend.release_lock(cache_key, token)
+
+        while await backend.is_locked(cache_key) and time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        _, value = await backend.get_with_ttl(cache_key)
+        if value is not None:
+            return coder.decode(value), True
+    with replica_router.refill([cache_key]):
+        result = await func(*args, **kwargs)
+    return result, cacheable is not None and not cacheable(result)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as If-None-Match requires
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+
+def cache_control(headers: dict, max_age: int) -> str:
+    # @cache sets max-age to the expiry of a fresh entry, or to what is left of it on a hit
+    try:
+        seconds = int(headers.get(b'cache-control', b'').decode('latin-1').removeprefix('max-age='))
+    except ValueError:
+        seconds = max_age
+    return f'public, max-age={min(seconds, max_age)}'
+
+
+class ConditionalRequestMiddleware:
+    # Takes over the validators @cache sets. Its own ETag hashes with Python's per-process hash(), so it differed
+    # between workers and never matched behind a load balancer. Here it is a digest of the body, the same for
+    # every worker. A cache hit never reaches Postgres, so a matching If-None-Match is answered from the
+    # cache alone. max_age caps the @cache expiry in Cache-Control, after that clients and CDNs revalidate
+
+    def __init__(self, app, max_age: int):
+        self.app = app
+        self.max_age = max_age
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = dict(scope['headers']).get(b'if-none-match', b'').decode('latin-1')
+        start = None
+        body = []
+
+        async def send_with_etag(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                headers = dict(message.get('headers', []))
+                # Only responses of @cache routes, streamed ones like the export pass through untouched
+                if message['status'] != 200 or b'etag' not in headers:
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            body.append(message.get('body', b''))
+            if message.get('more_body', False):
+                return
+
+            content = b''.join(body)
+            etag = f'W/"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+            control = cache_control(dict(start['headers']), self.max_age)
+            headers = [(name, value) for name, value in start['headers'] if name not in (b'etag', b'cache-control')]
+            headers += [(b'etag', etag.encode('latin-1')), (b'cache-control', control.encode('latin-1'))]
+            if if_none_match and etag_matches(if_none_match, etag):
+                headers = [(name, value) for name, value in headers
+                           if name not in (b'content-length', b'content-type')]
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            await send({**start, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': content})
+
+        await self.app(scope, receive, send_with_etag)
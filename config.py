@@ -3,17 +3,75 @@ import os
 
 load_dotenv()
 
+DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
+
 DB_USER = os.environ.get('DB_USER')
 DB_PASS = os.environ.get('DB_PASS')
 DB_HOST = os.environ.get('DB_HOST')
 DB_PORT = os.environ.get('DB_PORT')
 DB_NAME = os.environ.get('DB_NAME')
 
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', -1))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'false').lower() == 'true'
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true'
+
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+DB_REPLICA_PORT = os.environ.get('DB_REPLICA_PORT', DB_PORT)
+DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5))
+
+SQL_PROFILING = os.environ.get('SQL_PROFILING', 'false').lower() == 'true'
+SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 100))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+SQL_PROFILE_BUFFER_SIZE = int(os.environ.get('SQL_PROFILE_BUFFER_SIZE', 100))
+
+RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL', 900))
+RESERVATION_RELEASE_INTERVAL = float(os.environ.get('RESERVATION_RELEASE_INTERVAL', 30))
+# Product ids whose stock is gated by a Redis counter, e.g. for a flash sale
+INVENTORY_HOT_PRODUCTS = [int(product_id) for product_id in os.environ.get('INVENTORY_HOT_PRODUCTS', '').split(',')
+                          if product_id.strip()]
+
+# List totals are counted exactly up to this many rows and estimated by the planner above it
+COUNT_EXACT_LIMIT = int(os.environ.get('COUNT_EXACT_LIMIT', 10_000))
+COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', 300))
+# Seconds between full recounts of the trigger maintained category stats
+CATEGORY_STATS_REFRESH_INTERVAL = float(os.environ.get('CATEGORY_STATS_REFRESH_INTERVAL', 3600))
+
 SECRET = os.environ.get('SECRET_AUTH')
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 60))
+JWT_ROLE_CLAIMS = os.environ.get('JWT_ROLE_CLAIMS', 'false').lower() == 'true'
 
 SMTP_USER = os.environ.get('SMTP_USER')
 SMTP_PASS = os.environ.get('SMTP_PASS')
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 465))
+SMTP_SSL = os.environ.get('SMTP_SSL', 'true').lower() == 'true'
+SMTP_MAX_IDLE = float(os.environ.get('SMTP_MAX_IDLE', 60))
+# Messages per second for each worker process, 0 disables the limit
+SMTP_RATE_LIMIT = float(os.environ.get('SMTP_RATE_LIMIT', 10))
+SMTP_BATCH_SIZE = int(os.environ.get('SMTP_BATCH_SIZE', 50))
+SMTP_BATCH_WINDOW = float(os.environ.get('SMTP_BATCH_WINDOW', 1))
+SMTP_MAX_RETRIES = int(os.environ.get('SMTP_MAX_RETRIES', 5))
+SMTP_RETRY_BACKOFF = float(os.environ.get('SMTP_RETRY_BACKOFF', 2))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+# Seconds between outbox polls, emails written by this process wake the relay right away
+OUTBOX_RELAY_INTERVAL = float(os.environ.get('OUTBOX_RELAY_INTERVAL', 5))
 
 REDIS_HOST = os.environ.get('REDIS_HOST')
 REDIS_PORT = os.environ.get('REDIS_PORT')
 
+LOG_DIR = os.environ.get('LOG_DIR', 'logs')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+LOG_INFO_SAMPLE_RATE = float(os.environ.get('LOG_INFO_SAMPLE_RATE', 1))
+# Slot of this gunicorn worker, set in docker/gunicorn.conf.py
+LOG_WORKER_ID = os.environ.get('LOG_WORKER_ID')
+
+# Upper bound of max-age in Cache-Control for cached GET routes, past it clients revalidate with the ETag
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+CACHE_L1_MAXSIZE = int(os.environ.get('CACHE_L1_MAXSIZE', 1024))
+CACHE_L1_TTL = int(os.environ.get('CACHE_L1_TTL', 30))
@@ -1,12 +1,35 @@
-from typing import AsyncGenerator
+import asyncio
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, Optional
 
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.requests import cookie_parser
 
-from config import DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME
+from config import (DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_PGBOUNCER, DB_REPLICA_HOST,
+                    DB_REPLICA_PORT, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL)
+from metrics import DB_POOL_IN_USE, DB_POOL_IDLE, DB_POOL_WAITERS, DB_POOL_CHECKOUT_SECONDS, track_queries
 
 DATABASE_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+REPLICA_DATABASE_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}'
+
+LAST_WRITE_COOKIE = 'last_write'
+# Reads of this request go to the primary: its client wrote recently, or it refills a just invalidated cache entry
+read_from_primary: ContextVar[bool] = ContextVar('read_from_primary', default=False)
+# Times of the writes made by this request, see ReadYourWritesMiddleware
+request_writes: ContextVar[Optional[list]] = ContextVar('request_writes', default=None)
+
+REPLICA_LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
 
 
 class Base(DeclarativeBase):
@@ -15,10 +38,194 @@ class Base(DeclarativeBase):
 
 metadata = MetaData()
 
-engine = create_async_engine(DATABASE_URL)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # Set by make_engine, create_engine does not pass extra arguments through to the pool
+    pool_label = 'primary'
+
+    def recreate(self):
+        # dispose() and invalidation build a fresh pool through here, the label has to survive it
+        pool = super().recreate()
+        pool.pool_label = self.pool_label
+        return pool
+
+    def _do_get(self):
+        waiters = DB_POOL_WAITERS.labels(self.pool_label)
+        waiters.inc()
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        finally:
+            waiters.dec()
+            DB_POOL_CHECKOUT_SECONDS.labels(self.pool_label).observe(time.perf_counter() - started)
+        self.update_gauges()
+        return connection
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self.update_gauges()
+
+    def update_gauges(self):
+        DB_POOL_IN_USE.labels(self.pool_label).set(self.checkedout())
+        DB_POOL_IDLE.labels(self.pool_label).set(self.checkedin())
+
+
+def get_connect_args() -> dict:
+    if DB_PGBOUNCER:
+        # Transaction pooling hands each transaction a different server connection, so prepared statements
+        # must be neither cached nor reused by name
+        return {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid.uuid4()}__',
+        }
+    return {'statement_cache_size': DB_STATEMENT_CACHE_SIZE, 'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE}
+
+
+def make_engine(url: str, pool_label: str):
+    async_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=get_connect_args(),
+    )
+    async_engine.pool.pool_label = pool_label
+    track_queries(async_engine)
+    return async_engine
+
+
+engine = make_engine(DATABASE_URL, 'primary')
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+replica_engine = make_engine(REPLICA_DATABASE_URL, 'replica') if DB_REPLICA_HOST else None
+
+
+class ReplicaRouter:
+    # Reads go to the replica unless it is unhealthy or lagging. Read-your-writes is scoped to whoever wrote:
+    # the writing client's own reads go to the primary for max_lag seconds (ReadYourWritesMiddleware), and so
+    # does the refill of a cache entry invalidated within that time, so it cannot cache the pre-write rows.
+    # Everybody else keeps reading from the replica
+
+    MAX_INVALIDATIONS = 10_000
+
+    def __init__(self, replica_engine, max_lag: float, check_interval: float):
+        self.engine = replica_engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.healthy = replica_engine is not None
+        # Invalidated cache key or namespace -> monotonic time until which its refills read from the primary
+        self.invalidated: dict[str, float] = {}
+
+    def use_replica(self) -> bool:
+        return self.healthy and not read_from_primary.get()
+
+    def note_write(self) -> None:
+        writes = request_writes.get()
+        if writes is not None:
+            writes.append(time.time())
+
+    def note_invalidation(self, message: str) -> None:
+        # message is a TwoTierBackend invalidation, 'key:<cache key>' or 'namespace:<namespace>'
+        now = time.monotonic()
+        if len(self.invalidated) >= self.MAX_INVALIDATIONS:
+            self.invalidated = {target: until for target, until in self.invalidated.items() if until > now}
+        self.invalidated[message.partition(':')[2]] = now + self.max_lag
+
+    def invalidated_recently(self, cache_key: str) -> bool:
+        now = time.monotonic()
+        namespace = cache_key.rsplit(':', 1)[0]
+        return self.invalidated.get(cache_key, 0) > now or self.invalidated.get(namespace, 0) > now
+
+    @contextmanager
+    def refill(self, cache_keys: list[str]):
+        token = None
+        if any(self.invalidated_recently(cache_key) for cache_key in cache_keys):
+            token = read_from_primary.set(True)
+        try:
+            yield
+        finally:
+            if token is not None:
+                read_from_primary.reset(token)
+
+    async def check(self) -> bool:
+        try:
+            async with AsyncSession(self.engine) as session:
+                lag = await asyncio.wait_for(session.scalar(REPLICA_LAG_QUERY), timeout=self.check_interval)
+            return lag is not None and lag <= self.max_lag
+        except Exception:
+            return False
+
+    async def monitor(self) -> None:
+        if self.engine is None:
+            return
+        while True:
+            self.healthy = await self.check()
+            await asyncio.sleep(self.check_interval)
+
+
+replica_router = ReplicaRouter(replica_engine, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL)
+
+
+class ReadSession(Session):
+    # The engine is picked when the session first connects rather than when it is created, so a cache refill
+    # that starts inside the endpoint can still move its reads to the primary
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if replica_router.use_replica():
+            return replica_engine.sync_engine
+        return engine.sync_engine
+
+
+read_session_maker = async_sessionmaker(engine, class_=AsyncSession, sync_session_class=ReadSession,
+                                        expire_on_commit=False)
+
+
+class ReadYourWritesMiddleware:
+    # A request that wrote hands its client a last_write cookie, and while it is younger than max_lag
+    # that client's reads skip the replica
+
+    def __init__(self, app, max_lag: float):
+        self.app = app
+        self.max_lag = max_lag
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        cookies = cookie_parser(dict(scope['headers']).get(b'cookie', b'').decode('latin-1'))
+        try:
+            last_write = float(cookies.get(LAST_WRITE_COOKIE, ''))
+        except ValueError:
+            last_write = None
+        recent = last_write is not None and 0 <= time.time() - last_write < self.max_lag
+        primary_token = read_from_primary.set(True) if recent else None
+        writes = []
+        writes_token = request_writes.set(writes)
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start' and writes:
+                cookie = (f'{LAST_WRITE_COOKIE}={writes[-1]:.3f}; Max-Age={math.ceil(self.max_lag)}; Path=/; '
+                          f'HttpOnly; SameSite=Lax')
+                message['headers'] = [*message.get('headers', []), (b'set-cookie', cookie.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            request_writes.reset(writes_token)
+            if primary_token is not None:
+                read_from_primary.reset(primary_token)
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with read_session_maker() as session:
+        yield session
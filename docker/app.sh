@@ -2,4 +2,9 @@
 
 alembic upgrade heads
 
-gunicorn main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
\ No newline at end of file
+# Metric samples of all gunicorn workers are shared through this directory, it must start empty
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+gunicorn main:app --config docker/gunicorn.conf.py --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
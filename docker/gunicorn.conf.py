@@ -0,0 +1,19 @@
+import itertools
+import os
+
+from prometheus_client import multiprocess
+
+
+def pre_fork(server, worker):
+    # Lowest slot no live worker holds, a replacement worker gets the slot of the one that exited
+    taken = {getattr(other, 'log_worker_id', None) for other in server.WORKERS.values()}
+    worker.log_worker_id = next(slot for slot in itertools.count() if slot not in taken)
+
+
+def post_fork(server, worker):
+    # Read by config when the worker imports the app, log files are named by slot instead of pid
+    os.environ['LOG_WORKER_ID'] = str(worker.log_worker_id)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,151 @@
+import atexit
+import copy
+import logging
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from typing import Optional
+
+import orjson
+
+from config import LOG_DIR, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_INFO_SAMPLE_RATE, LOG_WORKER_ID
+from metrics import get_route
+
+# Fields of the request being served, None outside of requests
+log_context: ContextVar[Optional[dict]] = ContextVar('log_context', default=None)
+
+RECORD_FIELDS = ('status', 'latency_ms')
+
+_listeners: list[QueueListener] = []
+_exception_formatter = logging.Formatter()
+
+
+def bind_log_context(**fields) -> None:
+    context = log_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+class ContextFilter(logging.Filter):
+    # Runs in the caller before the record is queued, the listener thread cannot see the request context
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context is not None:
+            for field, value in context.items():
+                setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps a share of the records below WARNING, warnings and errors always pass
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for field in ('request_id', 'method', 'route', 'user_id', *RECORD_FIELDS):
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        return orjson.dumps(data).decode()
+
+
+class StructuredQueueHandler(QueueHandler):
+    # The stock prepare() appends the traceback to the message and drops exc_info. Here the message only gets
+    # its args merged and the traceback goes to exc_text, so the formatter still sees them apart
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Rendered here, the traceback's frames are not safe to hand to another thread
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logger(name: str, filename: str, level: int = logging.NOTSET, directory: str = LOG_DIR) -> logging.Logger:
+    # The caller only puts the record on a queue, a listener thread does the file I/O.
+    # Each worker writes its own rotating file, rotation is not safe with several writers. Files are named by
+    # the worker's slot (docker/gunicorn.conf.py), so a restarted worker appends to the files of the one it replaces
+    queue = SimpleQueue()
+    queue_handler = StructuredQueueHandler(queue)
+    queue_handler.addFilter(SamplingFilter(LOG_INFO_SAMPLE_RATE))
+    queue_handler.addFilter(ContextFilter())
+
+    if LOG_WORKER_ID is not None:
+        filename = f'{filename}.{LOG_WORKER_ID}'
+    file_handler = RotatingFileHandler(os.path.join(directory, f'{filename}.log'),
+                                       maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True)
+    file_handler.setFormatter(JsonFormatter())
+
+    listener = QueueListener(queue, file_handler)
+    listener.start()
+    _listeners.append(listener)
+
+    logger = logging.Logger(name=name, level=level)
+    logger.addHandler(queue_handler)
+    return logger
+
+
+@atexit.register
+def stop_listeners() -> None:
+    while _listeners:
+        _listeners.pop().stop()
+
+
+access_logger = setup_logger('access_logger', 'access', level=logging.INFO)
+
+
+class RequestContextMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope['headers'])
+        request_id = headers.get(b'x-request-id', b'')[:64].decode('latin-1') or uuid.uuid4().hex
+        context = {'request_id': request_id, 'method': scope['method'], 'route': get_route(scope)}
+        token = log_context.set(context)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = [*message.get('headers', []), (b'x-request-id', request_id.encode('latin-1'))]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            access_logger.info('request', extra={
+                'status': status,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            })
+            log_context.reset(token)
@@ -1,38 +1,67 @@
-import logging
+import asyncio
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
+from fastapi.responses import ORJSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 
-from auth.base_config import fastapi_users, auth_backend
+from auth.base_config import fastapi_users, auth_backend, current_user_claims
+from auth.outbox import relay_outbox
 from auth.schemas import UserRead, UserCreate
-from config import REDIS_HOST, REDIS_PORT
+from cache import (TaggedRedisBackend, TwoTierBackend, ORJsonCoder, ConditionalRequestMiddleware,
+                   request_key_builder)
+from config import (REDIS_HOST, REDIS_PORT, CACHE_L1_MAXSIZE, CACHE_L1_TTL, SQL_PROFILING, HTTP_CACHE_MAX_AGE,
+                    DB_REPLICA_MAX_LAG)
+from database import replica_router, ReadYourWritesMiddleware
+from logger import RequestContextMiddleware, setup_logger
+from metrics import CELERY_QUEUE_LENGTH, EMAIL_QUEUE_LENGTH, MetricsMiddleware, generate_metrics
+from orders.inventory import stock_counters, maintain_inventory
+from orders.router import reservations_router
 from products.router import products_router, categories_router
-from products.logger import products_formatter
+from products.stats import maintain_category_stats
+from tasks.celery_app import celery, EMAIL_QUEUE_KEY, EMAIL_DEAD_KEY
 
 from redis import asyncio as aioredis
 
 
-main_handler = logging.FileHandler(filename='logs/main.log')
-main_handler.setFormatter(products_formatter)
-
-main_logger = logging.Logger(name='main_logger')
-main_logger.addHandler(main_handler)
+main_logger = setup_logger('main_logger', 'main')
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     redis = aioredis.from_url(f'redis://{REDIS_HOST}:{REDIS_PORT}')
-    FastAPICache.init(RedisBackend(redis), prefix='fastapi-cache')
+    app.state.redis = redis
+    backend = TwoTierBackend(TaggedRedisBackend(redis), maxsize=CACHE_L1_MAXSIZE, ttl=CACHE_L1_TTL,
+                             on_invalidation=replica_router.note_invalidation)
+    FastAPICache.init(backend, prefix='fastapi-cache', coder=ORJsonCoder, key_builder=request_key_builder)
+    invalidations = asyncio.create_task(backend.listen_invalidations())
+    replica_monitor = asyncio.create_task(replica_router.monitor())
+    stock_counters.bind(redis)
+    inventory = asyncio.create_task(maintain_inventory())
+    outbox = asyncio.create_task(relay_outbox())
+    category_stats = asyncio.create_task(maintain_category_stats())
     yield
-
-
-app = FastAPI(lifespan=lifespan, title='Some Store')
+    invalidations.cancel()
+    replica_monitor.cancel()
+    inventory.cancel()
+    outbox.cancel()
+    category_stats.cancel()
+
+
+app = FastAPI(lifespan=lifespan, title='Some Store', default_response_class=ORJSONResponse)
+if SQL_PROFILING:
+    from profiling import setup_profiling
+    setup_profiling(app)
+app.add_middleware(ConditionalRequestMiddleware, max_age=HTTP_CACHE_MAX_AGE)
+app.add_middleware(ReadYourWritesMiddleware, max_lag=DB_REPLICA_MAX_LAG)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
 
 main_router = APIRouter()
 main_router.include_router(products_router)
 main_router.include_router(categories_router)
+main_router.include_router(reservations_router)
 
 main_router.include_router(
     fastapi_users.get_auth_router(auth_backend),
@@ -85,3 +114,33 @@ async def home_page():
             'details': 'Внутренняя ошибка сервера'
         })
 
+
+@app.get('/cache/stats')
+async def cache_stats(user=Depends(current_user_claims)):
+    if not (user.is_superuser or user.is_staff):
+        raise HTTPException(status_code=403, detail={
+            'status': 'forbidden',
+            'data': None,
+            'details': 'У вас недостаточно прав для просмотра статистики кэша'
+        })
+    return {
+        'status': 'success',
+        'data': FastAPICache.get_backend().stats(),
+        'details': None
+    }
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics(request: Request):
+    queue = celery.conf.task_default_queue
+    try:
+        # The broker shares our Redis, a queue is a plain list there, like the email lists the SMTP batches drain
+        async with request.app.state.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(queue).llen(EMAIL_QUEUE_KEY).llen(EMAIL_DEAD_KEY)
+            queue_length, pending, dead = await pipe.execute()
+        CELERY_QUEUE_LENGTH.labels(queue).set(queue_length)
+        EMAIL_QUEUE_LENGTH.labels(EMAIL_QUEUE_KEY).set(pending)
+        EMAIL_QUEUE_LENGTH.labels(EMAIL_DEAD_KEY).set(dead)
+    except Exception:
+        main_logger.error('Some metrics error')
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,126 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# pool is primary or replica
+DB_POOL_IN_USE = Gauge('db_pool_in_use', 'Connections checked out of the pool', ['pool'], multiprocess_mode='livesum')
+DB_POOL_IDLE = Gauge('db_pool_idle', 'Connections idle in the pool', ['pool'], multiprocess_mode='livesum')
+DB_POOL_WAITERS = Gauge(
+    'db_pool_waiters', 'Coroutines waiting for a pool connection', ['pool'], multiprocess_mode='livesum',
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'db_pool_checkout_seconds', 'Time spent waiting for a pool connection', ['pool'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL statements executed while serving a request', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_QUERY_SECONDS_PER_REQUEST = Histogram(
+    'db_query_seconds_per_request', 'Time spent in SQL statements while serving a request', ['route'],
+    buckets=LATENCY_BUCKETS,
+)
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests served', ['method', 'route', 'status'])
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests being served', ['method', 'route'], multiprocess_mode='livesum',
+)
+
+CACHE_HITS = Counter('cache_hits_total', 'fastapi-cache hits', ['namespace', 'tier'])
+CACHE_MISSES = Counter('cache_misses_total', 'fastapi-cache misses', ['namespace'])
+
+CELERY_QUEUE_LENGTH = Gauge(
+    'celery_queue_length', 'Tasks waiting in the Celery broker queue', ['queue'], multiprocess_mode='livemostrecent',
+)
+# emails:pending waits for the next SMTP batch, emails:dead holds the rejected ones
+EMAIL_QUEUE_LENGTH = Gauge(
+    'email_queue_length', 'Emails in the Redis email lists', ['list'], multiprocess_mode='livemostrecent',
+)
+
+# [statements, seconds] of the request being served, None outside of requests
+request_queries: ContextVar[Optional[list]] = ContextVar('request_queries', default=None)
+
+# Called as observer(engine, statement, parameters, seconds, executemany) after every statement, e.g. by profiling
+query_observers: list[Callable] = []
+
+
+def track_queries(engine) -> None:
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        queries = request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+        for observer in query_observers:
+            observer(engine, statement, parameters, elapsed, executemany)
+
+
+def get_route(scope) -> str:
+    # The path template, not the raw path, keeps label cardinality bounded
+    partial = None
+    for route in scope['app'].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or 'unmatched'
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope['method'], get_route(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        queries = [0, 0.0]
+        token = request_queries.set(queries)
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            in_progress.dec()
+            DB_QUERIES_PER_REQUEST.labels(route).observe(queries[0])
+            DB_QUERY_SECONDS_PER_REQUEST.labels(route).observe(queries[1])
+            request_queries.reset(token)
+
+
+def generate_metrics() -> bytes:
+    # Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR, whichever worker gets the
+    # scrape aggregates them all
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -7,6 +7,7 @@ from alembic import context
 
 from auth.models import metadata
 from products.models import metadata
+from orders.models import metadata
 from database import metadata
 
 from config import DB_USER, DB_HOST, DB_PORT, DB_NAME, DB_PASS
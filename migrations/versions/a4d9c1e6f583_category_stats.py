@@ -0,0 +1,100 @@
+"""category stats
+
+Revision ID: a4d9c1e6f583
+Revises: f2c6d8a4e317
+Create Date: 2026-10-17 21:36:18.204751
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d9c1e6f583'
+down_revision: Union[str, None] = 'f2c6d8a4e317'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Statement level, so a bulk import touches each category row once per statement instead of once per product.
+# Counts are applied as deltas. A bound is only recomputed when a removed row held it, min/max over
+# ix_product_category_id_price_id is an index lookup
+MAINTAIN_CATEGORY_STATS = """
+CREATE FUNCTION maintain_category_stats() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        -- Stock changes from reservations end here without locking any category row
+        IF NOT EXISTS (SELECT 1 FROM old_rows o JOIN new_rows n ON n.id = o.id
+                       WHERE n.category_id IS DISTINCT FROM o.category_id OR n.price <> o.price) THEN
+            RETURN NULL;
+        END IF;
+        PERFORM 1 FROM category_stats
+        WHERE category_id IN (SELECT category_id FROM old_rows UNION SELECT category_id FROM new_rows)
+        ORDER BY category_id FOR UPDATE;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM 1 FROM category_stats WHERE category_id IN (SELECT category_id FROM old_rows)
+        ORDER BY category_id FOR UPDATE;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE category_stats s SET product_count = s.product_count - o.removed
+        FROM (SELECT category_id, count(*) AS removed FROM old_rows WHERE category_id IS NOT NULL
+              GROUP BY category_id) o
+        WHERE s.category_id = o.category_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO category_stats (category_id, product_count, min_price, max_price)
+        SELECT category_id, count(*), min(price), max(price) FROM new_rows WHERE category_id IS NOT NULL
+        GROUP BY category_id ORDER BY category_id
+        ON CONFLICT (category_id) DO UPDATE SET
+            product_count = category_stats.product_count + excluded.product_count,
+            min_price = least(category_stats.min_price, excluded.min_price),
+            max_price = greatest(category_stats.max_price, excluded.max_price);
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE category_stats s SET
+            min_price = (SELECT min(price) FROM product p WHERE p.category_id = s.category_id),
+            max_price = (SELECT max(price) FROM product p WHERE p.category_id = s.category_id)
+        WHERE s.category_id IN (SELECT o.category_id FROM old_rows o JOIN category_stats c
+                                ON c.category_id = o.category_id
+                                WHERE o.price <= c.min_price OR o.price >= c.max_price);
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+
+def upgrade() -> None:
+    op.create_table('category_stats',
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Integer(), nullable=True),
+    sa.Column('max_price', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('category_id')
+    )
+    op.execute(MAINTAIN_CATEGORY_STATS)
+    # Transition tables allow a single event per trigger
+    op.execute('CREATE TRIGGER product_category_stats_insert AFTER INSERT ON product '
+               'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION maintain_category_stats()')
+    op.execute('CREATE TRIGGER product_category_stats_update AFTER UPDATE ON product '
+               'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+               'FOR EACH STATEMENT EXECUTE FUNCTION maintain_category_stats()')
+    op.execute('CREATE TRIGGER product_category_stats_delete AFTER DELETE ON product '
+               'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION maintain_category_stats()')
+    # Product writes wait on the trigger's lock until this commits, so the backfill cannot miss one
+    op.execute('INSERT INTO category_stats (category_id, product_count, min_price, max_price) '
+               'SELECT c.id, count(p.id), min(p.price), max(p.price) FROM category c '
+               'LEFT JOIN product p ON p.category_id = c.id GROUP BY c.id')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER product_category_stats_delete ON product')
+    op.execute('DROP TRIGGER product_category_stats_update ON product')
+    op.execute('DROP TRIGGER product_category_stats_insert ON product')
+    op.execute('DROP FUNCTION maintain_category_stats()')
+    op.drop_table('category_stats')
@@ -0,0 +1,45 @@
+"""product catalog indexes
+
+Revision ID: b7d41c9e2f60
+Revises: 5a3f8ddc106c
+Create Date: 2026-10-17 12:04:11.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41c9e2f60'
+down_revision: Union[str, None] = '5a3f8ddc106c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # CONCURRENTLY can't run inside the migration transaction, but keeps the catalog writable while building
+    with op.get_context().autocommit_block():
+        op.create_index('ix_product_category_id', 'product', ['category_id'], postgresql_concurrently=True)
+        op.create_index('ix_product_author_id', 'product', ['author_id'], postgresql_concurrently=True)
+        op.create_index('ix_product_title_id', 'product', ['title', 'id'], postgresql_concurrently=True)
+        op.create_index('ix_product_price_id', 'product', ['price', 'id'], postgresql_concurrently=True)
+        op.create_index('ix_product_title_price_id', 'product', ['title', 'price', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_product_price_title_id', 'product', ['price', 'title', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_product_title_trgm', 'product', ['title'], postgresql_using='gin',
+                        postgresql_ops={'title': 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_product_title_trgm', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_price_title_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_title_price_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_price_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_title_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_author_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_category_id', table_name='product', postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""catalog updated_at
+
+Revision ID: b8e3f5a2c716
+Revises: a4d9c1e6f583
+Create Date: 2026-10-17 22:58:31.640273
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e3f5a2c716'
+down_revision: Union[str, None] = 'a4d9c1e6f583'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # now() is stable, so the default is evaluated once and existing rows are not rewritten
+    op.add_column('product', sa.Column('updated_at', sa.TIMESTAMP(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+    op.add_column('category', sa.Column('updated_at', sa.TIMESTAMP(), nullable=False,
+                                        server_default=sa.text("timezone('utc', now())")))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_product_updated_at_id', 'product', ['updated_at', 'id'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_product_updated_at_id', table_name='product', postgresql_concurrently=True)
+    op.drop_column('category', 'updated_at')
+    op.drop_column('product', 'updated_at')
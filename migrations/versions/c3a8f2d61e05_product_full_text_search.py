@@ -0,0 +1,41 @@
+"""product full text search
+
+Revision ID: c3a8f2d61e05
+Revises: b7d41c9e2f60
+Create Date: 2026-10-17 14:22:47.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a8f2d61e05'
+down_revision: Union[str, None] = 'b7d41c9e2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('product', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_product_search_vector', 'product', ['search_vector'], postgresql_using='gin',
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_product_search_vector', table_name='product', postgresql_concurrently=True)
+    op.drop_column('product', 'search_vector')
@@ -0,0 +1,42 @@
+"""product range filter indexes
+
+Revision ID: d9e4b7a15c32
+Revises: c3a8f2d61e05
+Create Date: 2026-10-17 15:40:03.558710
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9e4b7a15c32'
+down_revision: Union[str, None] = 'c3a8f2d61e05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # category_id and author_id lead the new composites, so the single column indexes are redundant
+        op.create_index('ix_product_category_id_price_id', 'product', ['category_id', 'price', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_product_author_id_id', 'product', ['author_id', 'id'], postgresql_concurrently=True)
+        op.drop_index('ix_product_category_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_author_id', table_name='product', postgresql_concurrently=True)
+        op.create_index('ix_product_in_stock_id', 'product', ['id'], postgresql_where=sa.text('quantity > 0'),
+                        postgresql_concurrently=True)
+        op.create_index('ix_product_in_stock_price_id', 'product', ['price', 'id'],
+                        postgresql_where=sa.text('quantity > 0'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_product_in_stock_price_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_in_stock_id', table_name='product', postgresql_concurrently=True)
+        op.create_index('ix_product_author_id', 'product', ['author_id'], postgresql_concurrently=True)
+        op.create_index('ix_product_category_id', 'product', ['category_id'], postgresql_concurrently=True)
+        op.drop_index('ix_product_author_id_id', table_name='product', postgresql_concurrently=True)
+        op.drop_index('ix_product_category_id_price_id', table_name='product', postgresql_concurrently=True)
@@ -0,0 +1,49 @@
+"""product reservations
+
+Revision ID: e5f1a7c2b894
+Revises: d9e4b7a15c32
+Create Date: 2026-10-17 18:12:44.301927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f1a7c2b894'
+down_revision: Union[str, None] = 'd9e4b7a15c32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('expires_at', sa.TIMESTAMP(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reservation_user_id_id', 'reservation', ['user_id', 'id'])
+    op.create_index('ix_reservation_active_expires_at', 'reservation', ['expires_at'],
+                    postgresql_where=sa.text("status = 'active'"))
+    # NOT VALID only takes the exclusive lock long enough to add the constraint, without scanning the table.
+    # VALIDATE scans under SHARE UPDATE EXCLUSIVE, which lets writes through, but only once the ADD has been
+    # committed: in the same transaction the exclusive lock would be held for the whole scan
+    op.execute('ALTER TABLE product ADD CONSTRAINT ck_product_quantity_non_negative CHECK (quantity >= 0) NOT VALID')
+    with op.get_context().autocommit_block():
+        op.execute('ALTER TABLE product VALIDATE CONSTRAINT ck_product_quantity_non_negative')
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_product_quantity_non_negative', 'product', type_='check')
+    op.drop_index('ix_reservation_active_expires_at', table_name='reservation')
+    op.drop_index('ix_reservation_user_id_id', table_name='reservation')
+    op.drop_table('reservation')
@@ -0,0 +1,147 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import RESERVATION_TTL, RESERVATION_RELEASE_INTERVAL, INVENTORY_HOT_PRODUCTS
+from database import async_session_maker
+from orders.logger import orders_logger
+from orders.models import Reservation, RESERVATION_ACTIVE, RESERVATION_RELEASED
+from products.cache import invalidate_stock
+from products.models import Product
+
+STOCK_KEY_PREFIX = 'inventory:stock:'
+
+# -1: no counter yet, -2: not enough stock, otherwise the stock left
+TAKE_STOCK_SCRIPT = """
+local stock = redis.call('GET', KEYS[1])
+if not stock then
+    return -1
+end
+if tonumber(stock) < tonumber(ARGV[1]) then
+    return -2
+end
+return redis.call('DECRBY', KEYS[1], ARGV[1])
+"""
+
+RETURN_STOCK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return -1
+"""
+
+
+class StockCounters:
+    # Redis counters in front of the conditional UPDATE for hot products. They only turn buyers away early,
+    # the UPDATE still decides, so a counter that drifts can cost a sale but never oversell.
+    # reconcile() resets them to the database stock
+
+    def __init__(self, product_ids: list[int]):
+        self.product_ids = set(product_ids)
+        self.redis = None
+
+    def bind(self, redis) -> None:
+        self.redis = redis
+
+    def enabled_for(self, product_id: int) -> bool:
+        return self.redis is not None and product_id in self.product_ids
+
+    async def admit(self, session: AsyncSession, product_id: int, quantity: int) -> bool:
+        if not self.enabled_for(product_id):
+            return True
+        key = f'{STOCK_KEY_PREFIX}{product_id}'
+        try:
+            left = await self.redis.eval(TAKE_STOCK_SCRIPT, 1, key, quantity)
+            if left == -1:
+                stock = await session.scalar(select(Product.quantity).where(Product.id == product_id))
+                await self.redis.set(key, stock or 0, nx=True)
+                left = await self.redis.eval(TAKE_STOCK_SCRIPT, 1, key, quantity)
+        except Exception:
+            orders_logger.error(f'Some admit error for product {product_id}')
+            return True
+        return left >= 0
+
+    async def give_back(self, product_id: int, quantity: int) -> None:
+        if not self.enabled_for(product_id):
+            return
+        try:
+            await self.redis.eval(RETURN_STOCK_SCRIPT, 1, f'{STOCK_KEY_PREFIX}{product_id}', quantity)
+        except Exception:
+            orders_logger.error(f'Some give_back error for product {product_id}')
+
+    async def reconcile(self, session: AsyncSession) -> None:
+        if self.redis is None or not self.product_ids:
+            return
+        result = await session.execute(select(Product.id, Product.quantity).where(Product.id.in_(self.product_ids)))
+        for product_id, quantity in result.all():
+            await self.redis.set(f'{STOCK_KEY_PREFIX}{product_id}', quantity)
+
+
+stock_counters = StockCounters(INVENTORY_HOT_PRODUCTS)
+
+
+async def take_stock(session: AsyncSession, product_id: int, quantity: int) -> Optional[int]:
+    # One conditional UPDATE: concurrent buyers queue on the row lock and each re-checks the stock it left
+    stmt = (update(Product).where(Product.id == product_id, Product.quantity >= quantity)
+            .values(quantity=Product.quantity - quantity).returning(Product.quantity))
+    return (await session.execute(stmt)).scalar_one_or_none()
+
+
+async def return_stock(session: AsyncSession, quantities: dict[int, int]) -> None:
+    # Sorted, so that concurrent releases lock the product rows in the same order
+    for product_id in sorted(quantities):
+        await session.execute(update(Product).where(Product.id == product_id)
+                              .values(quantity=Product.quantity + quantities[product_id]))
+
+
+async def reserve(session: AsyncSession, user_id: int, product_id: int, quantity: int) -> Optional[dict]:
+    # None when the product is missing or out of stock
+    if not await stock_counters.admit(session, product_id, quantity):
+        return None
+    if await take_stock(session, product_id, quantity) is None:
+        await stock_counters.give_back(product_id, quantity)
+        return None
+    stmt = insert(Reservation).values(
+        product_id=product_id,
+        user_id=user_id,
+        quantity=quantity,
+        status=RESERVATION_ACTIVE,
+        expires_at=datetime.utcnow() + timedelta(seconds=RESERVATION_TTL),
+    ).returning(Reservation.id, Reservation.product_id, Reservation.quantity, Reservation.expires_at)
+    reservation = dict((await session.execute(stmt)).mappings().one())
+    await session.commit()
+    await invalidate_stock([product_id])
+    return reservation
+
+
+async def release_expired(session: AsyncSession) -> dict[int, int]:
+    # Safe to run in every worker at once: a reservation leaves the active state only once
+    stmt = (update(Reservation)
+            .where(Reservation.status == RESERVATION_ACTIVE, Reservation.expires_at <= datetime.utcnow())
+            .values(status=RESERVATION_RELEASED).returning(Reservation.product_id, Reservation.quantity))
+    released = defaultdict(int)
+    for product_id, quantity in (await session.execute(stmt)).all():
+        released[product_id] += quantity
+    await return_stock(session, released)
+    await session.commit()
+    return released
+
+
+async def maintain_inventory() -> None:
+    while True:
+        try:
+            async with async_session_maker() as session:
+                released = await release_expired(session)
+                # Also picks up the stock just released
+                await stock_counters.reconcile(session)
+            if released:
+                await invalidate_stock(list(released))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            orders_logger.error('Some maintain_inventory error')
+        await asyncio.sleep(RESERVATION_RELEASE_INTERVAL)
@@ -0,0 +1,3 @@
+from logger import setup_logger
+
+orders_logger = setup_logger('orders_logger', 'orders')
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Index, text
+
+from database import Base, metadata
+
+RESERVATION_ACTIVE = 'active'
+RESERVATION_COMPLETED = 'completed'
+RESERVATION_RELEASED = 'released'
+
+
+class Reservation(Base):
+    __tablename__ = 'reservation'
+    metadata = metadata
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(ForeignKey('user.id'), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default=RESERVATION_ACTIVE)
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    expires_at = Column(TIMESTAMP, nullable=False)
+
+    __table_args__ = (
+        Index('ix_reservation_user_id_id', 'user_id', 'id'),
+        Index('ix_reservation_active_expires_at', 'expires_at', postgresql_where=text("status = 'active'")),
+    )
@@ -0,0 +1,120 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.base_config import current_user_claims
+from database import get_async_session
+from orders.inventory import reserve, return_stock, stock_counters
+from orders.logger import orders_logger
+from orders.models import Reservation, RESERVATION_ACTIVE, RESERVATION_COMPLETED, RESERVATION_RELEASED
+from orders.schemas import ReservationCreate
+from products.cache import invalidate_stock
+from products.models import Product
+
+reservations_router = APIRouter(
+    prefix='/reservations',
+    tags=['Reservation']
+)
+
+
+@reservations_router.post('/')
+async def reserve_product(reservation_data: ReservationCreate, session: AsyncSession = Depends(get_async_session),
+                          user=Depends(current_user_claims)):
+    try:
+        reservation = await reserve(session, user.id, reservation_data.product_id, reservation_data.quantity)
+        if reservation is not None:
+            return {
+                'status': 'success',
+                'data': reservation,
+                'details': 'Товар забронирован!'
+            }
+        # reserve() returns None both for a missing product and for short stock, so the failed reservation looks
+        # the product up to answer 404 or 409
+        exists = await session.scalar(select(Product.id).where(Product.id == reservation_data.product_id))
+    except Exception:
+        orders_logger.error('Some reserve_product error')
+        raise HTTPException(status_code=500, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Внутренняя ошибка сервера'
+        })
+    if exists:
+        raise HTTPException(status_code=409, detail={
+            'status': 'out_of_stock',
+            'data': None,
+            'details': 'Недостаточно товара на складе'
+        })
+    return {
+        'status': 'not_found',
+        'data': None,
+        'details': 'Продукт не найден'
+    }
+
+
+@reservations_router.post('/{reservation_id}/checkout')
+async def checkout_reservation(reservation_id: int, session: AsyncSession = Depends(get_async_session),
+                               user=Depends(current_user_claims)):
+    try:
+        # The stock was taken at reservation time, checkout only makes it final
+        stmt = (update(Reservation)
+                .where(Reservation.id == reservation_id, Reservation.user_id == user.id,
+                       Reservation.status == RESERVATION_ACTIVE, Reservation.expires_at > datetime.utcnow())
+                .values(status=RESERVATION_COMPLETED).returning(Reservation.id))
+        result = await session.execute(stmt)
+        if result.scalar_one_or_none() is not None:
+            await session.commit()
+            return {
+                'status': 'success',
+                'data': None,
+                'details': 'Заказ оформлен!'
+            }
+        else:
+            return {
+                'status': 'not_found',
+                'data': None,
+                'details': 'Активная бронь не найдена'
+            }
+    except Exception:
+        orders_logger.error('Some checkout_reservation error')
+        raise HTTPException(status_code=500, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Внутренняя ошибка сервера'
+        })
+
+
+@reservations_router.delete('/{reservation_id}')
+async def release_reservation(reservation_id: int, session: AsyncSession = Depends(get_async_session),
+                              user=Depends(current_user_claims)):
+    try:
+        stmt = (update(Reservation)
+                .where(Reservation.id == reservation_id, Reservation.user_id == user.id,
+                       Reservation.status == RESERVATION_ACTIVE)
+                .values(status=RESERVATION_RELEASED).returning(Reservation.product_id, Reservation.quantity))
+        released = (await session.execute(stmt)).first()
+        if released is not None:
+            product_id, quantity = released
+            await return_stock(session, {product_id: quantity})
+            await session.commit()
+            await stock_counters.give_back(product_id, quantity)
+            await invalidate_stock([product_id])
+            return {
+                'status': 'success',
+                'data': None,
+                'details': 'Бронь отменена'
+            }
+        else:
+            return {
+                'status': 'not_found',
+                'data': None,
+                'details': 'Активная бронь не найдена'
+            }
+    except Exception:
+        orders_logger.error('Some release_reservation error')
+        raise HTTPException(status_code=500, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Внутренняя ошибка сервера'
+        })
@@ -0,0 +1,6 @@
+from pydantic import BaseModel, Field
+
+
+class ReservationCreate(BaseModel):
+    product_id: int = Field(ge=1)
+    quantity: int = Field(ge=1, le=100)
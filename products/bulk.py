@@ -0,0 +1,168 @@
+import csv
+import json
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import Integer, String, column, insert, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from products.models import Product
+from products.schemas import ProductBulkRow
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+COPY_COLUMNS = ('title', 'description', 'price', 'quantity', 'category_id', 'author_id')
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b''
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.decode().rstrip('\r')
+    if buffer:
+        yield buffer.decode().rstrip('\r')
+
+
+async def iter_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, object]]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+async def iter_csv(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, object]]:
+    # A quoted field may span lines; a record is complete once its quotes are balanced
+    header = None
+    record, record_line, line_number = [], 0, 0
+    async for line in lines:
+        line_number += 1
+        if not record:
+            record_line = line_number
+        record.append(line)
+        text = '\n'.join(record)
+        if text.count('"') % 2:
+            continue
+        record = []
+        if not text.strip():
+            continue
+        fields = next(csv.reader([text]))
+        if header is None:
+            header = [field.strip() for field in fields]
+            continue
+        yield record_line, {name: value if value != '' else None for name, value in zip(header, fields)}
+    if record:
+        yield record_line, None
+
+
+def validate(raw) -> tuple[Optional[ProductBulkRow], Optional[list[str]]]:
+    if not isinstance(raw, dict):
+        return None, ['Строка не является объектом продукта']
+    try:
+        return ProductBulkRow.model_validate(raw), None
+    except ValidationError as e:
+        return None, [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+
+class BulkImport:
+    def __init__(self, session: AsyncSession, author_id: int, can_update_any: bool):
+        self.session = session
+        self.author_id = author_id
+        self.can_update_any = can_update_any
+        self.inserted = 0
+        self.updated_ids: list[int] = []
+        self.errors_count = 0
+        self.errors: list[dict] = []
+
+    def add_error(self, line: int, errors: list[str]) -> None:
+        self.errors_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    async def run(self, records: AsyncIterator[tuple[int, object]]) -> None:
+        batch = []
+        async for line, raw in records:
+            row, errors = validate(raw)
+            if errors:
+                self.add_error(line, errors)
+                continue
+            batch.append((line, row))
+            if len(batch) >= BATCH_SIZE:
+                await self.write(batch)
+                batch = []
+        if batch:
+            await self.write(batch)
+
+    async def write(self, batch: list[tuple[int, ProductBulkRow]]) -> None:
+        new_rows = [row for _, row in batch if row.id is None]
+        existing_rows = [(line, row) for line, row in batch if row.id is not None]
+        try:
+            async with self.session.begin_nested():
+                await self.copy(new_rows)
+                updated_ids = await self.update_existing(existing_rows)
+        except Exception:
+            # One bad row (e.g. unknown category_id) fails the whole statement, retry row by row to pinpoint it
+            for line, row in batch:
+                try:
+                    async with self.session.begin_nested():
+                        if row.id is None:
+                            await self.session.execute(insert(Product).values(**self.to_record(row)))
+                        else:
+                            updated_ids = await self.update_existing([(line, row)])
+                except Exception as e:
+                    self.add_error(line, [str(getattr(e, 'orig', e)).splitlines()[0]])
+                    continue
+                if row.id is None:
+                    self.inserted += 1
+                else:
+                    self.report_updates([(line, row)], updated_ids)
+        else:
+            self.inserted += len(new_rows)
+            self.report_updates(existing_rows, updated_ids)
+        await self.session.commit()
+
+    def to_record(self, row: ProductBulkRow) -> dict:
+        return {**row.dict(exclude={'id'}), 'author_id': self.author_id}
+
+    async def copy(self, rows: list[ProductBulkRow]) -> None:
+        if not rows:
+            return
+        connection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        records = [tuple(self.to_record(row)[name] for name in COPY_COLUMNS) for row in rows]
+        await raw_connection.driver_connection.copy_records_to_table(
+            Product.__tablename__, records=records, columns=COPY_COLUMNS
+        )
+
+    async def update_existing(self, rows: list[tuple[int, ProductBulkRow]]) -> set[int]:
+        if not rows:
+            return set()
+        data = values(
+            column('id', Integer), column('title', String), column('description', String),
+            column('price', Integer), column('quantity', Integer), column('category_id', Integer),
+            name='data',
+        ).data([(row.id, row.title, row.description, row.price, row.quantity, row.category_id) for _, row in rows])
+        stmt = (
+            update(Product)
+            .where(Product.id == data.c.id)
+            .values(title=data.c.title, description=data.c.description, price=data.c.price,
+                    quantity=data.c.quantity, category_id=data.c.category_id)
+            .returning(Product.id)
+        )
+        if not self.can_update_any:
+            stmt = stmt.where(Product.author_id == self.author_id)
+        result = await self.session.execute(stmt)
+        return set(result.scalars().all())
+
+    def report_updates(self, rows: list[tuple[int, ProductBulkRow]], updated_ids: set[int]) -> None:
+        for line, row in rows:
+            if row.id in updated_ids:
+                self.updated_ids.append(row.id)
+            else:
+                self.add_error(line, ['Продукт не найден или у вас недостаточно прав для его обновления'])
@@ -0,0 +1,117 @@
+import hashlib
+from typing import Optional
+
+from fastapi_cache import FastAPICache
+
+from cache import namespace_key, request_key_builder
+from database import replica_router
+from products.logger import products_logger
+from products.search import normalize_query
+
+PRODUCT_NAMESPACE = 'get_product_id'
+PRODUCTS_NAMESPACE = 'get_many_products'
+CATEGORIES_NAMESPACE = 'get_categories'
+CATEGORY_STATS_NAMESPACE = 'get_categories_with_stats'
+SEARCH_NAMESPACE = 'search_products'
+PRODUCTS_COUNT_NAMESPACE = 'count_products'
+
+PRODUCT_EXPIRE = 21600
+
+
+def product_key_builder(func, namespace: Optional[str] = '', request=None, response=None, args=None,
+                        kwargs=None) -> str:
+    return namespace_key(PRODUCT_NAMESPACE, kwargs['product_id'])
+
+
+def categories_key_builder(func, namespace: Optional[str] = '', request=None, response=None, args=None,
+                           kwargs=None) -> str:
+    # Listings with stats change with product writes, a namespace of their own keeps the plain ones cached
+    if (kwargs or {}).get('with_stats'):
+        namespace = CATEGORY_STATS_NAMESPACE
+    return request_key_builder(func, namespace, request, response, args, kwargs)
+
+
+def product_found(response: dict) -> bool:
+    # A miss is not cached: nothing evicts a detail key when the product is created, COPY imports included
+    return bool(response['data'])
+
+
+def search_key_builder(func, namespace: Optional[str] = '', request=None, response=None, args=None,
+                       kwargs=None) -> str:
+    normalized = ' '.join(normalize_query(kwargs['q']))
+    return namespace_key(SEARCH_NAMESPACE, hashlib.md5(f"{normalized}:{kwargs['limit']}".encode()).hexdigest())
+
+
+async def get_cached_products(product_ids: list[int]) -> dict[int, list]:
+    # Reads the get_product_id entries of many products at once. Only ids found in the cache are returned,
+    # with their data list, which is empty for a product that was cached as missing
+    try:
+        values = await FastAPICache.get_backend().get_many([namespace_key(PRODUCT_NAMESPACE, product_id)
+                                                            for product_id in product_ids])
+    except Exception:
+        products_logger.error('Some get_cached_products error')
+        return {}
+    coder = FastAPICache.get_coder()
+    return {product_id: coder.decode(value)['data'] for product_id, value in zip(product_ids, values)
+            if value is not None}
+
+
+async def cache_products(rows: list) -> None:
+    # Same entries get_product_id writes, so either path fills the cache for the other
+    coder = FastAPICache.get_coder()
+    items = {
+        namespace_key(PRODUCT_NAMESPACE, row['id']): coder.encode({'status': 'success', 'data': [row], 'details': None})
+        for row in rows
+    }
+    if not items:
+        return
+    try:
+        await FastAPICache.get_backend().set_many(items, PRODUCT_EXPIRE)
+    except Exception:
+        products_logger.error('Some cache_products error')
+
+
+async def invalidate_product(product_id: Optional[int] = None) -> None:
+    await invalidate_products([product_id] if product_id is not None else [])
+
+
+async def invalidate_products(product_ids: list[int]) -> None:
+    replica_router.note_write()
+    try:
+        backend = FastAPICache.get_backend()
+        for product_id in product_ids:
+            await backend.clear(key=namespace_key(PRODUCT_NAMESPACE, product_id))
+        await FastAPICache.clear(namespace=PRODUCTS_NAMESPACE)
+        await FastAPICache.clear(namespace=SEARCH_NAMESPACE)
+        await FastAPICache.clear(namespace=PRODUCTS_COUNT_NAMESPACE)
+        # Listings with stats carry product counts and prices, plain category listings are not affected
+        await FastAPICache.clear(namespace=CATEGORY_STATS_NAMESPACE)
+    except Exception:
+        products_logger.error('Some invalidate_product error')
+
+
+async def invalidate_categories() -> None:
+    replica_router.note_write()
+    try:
+        await FastAPICache.clear(namespace=CATEGORIES_NAMESPACE)
+        await FastAPICache.clear(namespace=CATEGORY_STATS_NAMESPACE)
+    except Exception:
+        products_logger.error('Some invalidate_categories error')
+
+
+async def invalidate_category_stats() -> None:
+    try:
+        await FastAPICache.clear(namespace=CATEGORY_STATS_NAMESPACE)
+    except Exception:
+        products_logger.error('Some invalidate_category_stats error')
+
+
+async def invalidate_stock(product_ids: list[int]) -> None:
+    # Only the detail entries: stock in cached listings may lag by their TTL, a reservation is what counts.
+    # Not a note_write(), a buyer's cart reads need not skip the replica
+    try:
+        backend = FastAPICache.get_backend()
+        for product_id in product_ids:
+            await backend.clear(key=namespace_key(PRODUCT_NAMESPACE, product_id))
+    except Exception:
+        products_logger.error('Some invalidate_stock error')
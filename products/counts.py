@@ -0,0 +1,65 @@
+import hashlib
+import json
+
+import orjson
+from fastapi_cache import FastAPICache
+from sqlalchemy import Select, select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import namespace_key
+from config import COUNT_CACHE_TTL, COUNT_EXACT_LIMIT
+from products.logger import products_logger
+
+
+def count_key(namespace: str, filter_params: dict) -> str:
+    # Ordering and pages do not change the total, every page of a filter shares one entry
+    params = {name: value for name, value in filter_params.items() if name != 'order_by'}
+    return namespace_key(namespace, hashlib.md5(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest())
+
+
+async def estimate_rows(session: AsyncSession, query: Select, table: str, filtered: bool) -> int:
+    if not filtered:
+        # Kept up to date by autovacuum/ANALYZE, -1 until the table has been analyzed once
+        reltuples = await session.scalar(
+            text('SELECT CAST(reltuples AS bigint) FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+            {'table': table},
+        )
+        if reltuples is not None and reltuples >= 0:
+            return reltuples
+    connection = await session.connection()
+    compiled = query.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup or [])
+    result = await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', parameters)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+async def count_rows(session: AsyncSession, query: Select, table: str, filtered: bool) -> tuple[int, bool]:
+    # (total, estimated). The exact count stops after COUNT_EXACT_LIMIT rows, so its cost is bounded
+    # whatever the filter matches; past that the planner's estimate is used
+    capped = query.limit(COUNT_EXACT_LIMIT + 1).subquery()
+    total = await session.scalar(select(func.count()).select_from(capped))
+    if total <= COUNT_EXACT_LIMIT:
+        return total, False
+    return max(await estimate_rows(session, query, table, filtered), total), True
+
+
+async def get_total(session: AsyncSession, query: Select, table: str, namespace: str,
+                    filter_params: dict) -> tuple[int, bool]:
+    key = count_key(namespace, filter_params)
+    try:
+        cached = await FastAPICache.get_backend().get(key)
+        if cached is not None:
+            total, estimated = orjson.loads(cached)
+            return total, estimated
+    except Exception:
+        products_logger.error('Some get_total cache error')
+    total, estimated = await count_rows(session, query, table, filtered=any(
+        value is not None for name, value in filter_params.items() if name != 'order_by'))
+    try:
+        await FastAPICache.get_backend().set(key, orjson.dumps([total, estimated]), expire=COUNT_CACHE_TTL)
+    except Exception:
+        products_logger.error('Some get_total cache error')
+    return total, estimated
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+
+from database import read_session_maker
+from products.filters import ProductFilter
+from products.logger import products_logger
+from products.models import Product, PRODUCT_COLUMNS
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = PRODUCT_COLUMNS
+
+
+def to_ndjson(rows) -> str:
+    return ''.join(json.dumps(dict(row._mapping), ensure_ascii=False, default=datetime.isoformat) + '\n'
+                   for row in rows)
+
+
+def to_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+async def iter_export(product_filter: ProductFilter, since: Optional[int], export_format: str,
+                      updated_since: Optional[datetime] = None) -> AsyncIterator[str]:
+    query = product_filter.filter(select(*EXPORT_COLUMNS))
+    if updated_since is not None:
+        # The last exported updated_at is the watermark for the next pull, it picks up edits as well as new rows.
+        # Inclusive, and updated_at is the writing transaction's start time, so consumers upsert by id and should
+        # start the next pull a little before the watermark
+        query = query.where(Product.updated_at >= updated_since).order_by(Product.updated_at, Product.id)
+    else:
+        # Ordered by id so the last exported id is the watermark for the next pull of new rows
+        query = query.order_by(Product.id)
+    if since is not None:
+        query = query.where(Product.id > since)
+    serialize = to_csv if export_format == 'csv' else to_ndjson
+    if export_format == 'csv':
+        yield to_csv([[column.name for column in EXPORT_COLUMNS]])
+
+    # The request's session is closed before the body is streamed, so the export owns its own
+    try:
+        async with read_session_maker() as session:
+            result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield serialize(rows)
+    except Exception:
+        products_logger.error('Some export_products error')
+        raise
@@ -7,7 +7,13 @@ from products.models import Product, Category
 
 class ProductFilter(Filter):
     title: Optional[str] = None
+    title__ilike: Optional[str] = None
     price: Optional[int] = None
+    price__gte: Optional[int] = None
+    price__lte: Optional[int] = None
+    quantity__gt: Optional[int] = None
+    category_id__in: Optional[list[int]] = None
+    author_id: Optional[int] = None
     order_by: Optional[list[str]] = None
 
     class Constants(Filter.Constants):
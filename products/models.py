@@ -1,7 +1,19 @@
-from sqlalchemy import Table, Column, Integer, String, DECIMAL, ForeignKey, Float
+from sqlalchemy import (Table, Column, Integer, String, DECIMAL, ForeignKey, Float, Index, Computed, text,
+                        CheckConstraint, TIMESTAMP, func)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 
 from database import Base, metadata
 
+# Naive UTC like the datetime.utcnow defaults elsewhere. The server default also covers COPY imports,
+# onupdate covers every Core update(), reservations' stock changes included
+UTC_NOW = func.timezone('utc', func.now())
+
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+
 
 class Category(Base):
     __tablename__ = 'category'
@@ -9,6 +21,7 @@ class Category(Base):
 
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False, unique=True)
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=UTC_NOW, onupdate=UTC_NOW)
 
 
 class Product(Base):
@@ -22,3 +35,35 @@ class Product(Base):
     quantity = Column(Integer, nullable=False)
     category_id = Column(ForeignKey('category.id'))
     author_id = Column(ForeignKey('user.id'))
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=UTC_NOW, onupdate=UTC_NOW)
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True)))
+
+    __table_args__ = (
+        CheckConstraint('quantity >= 0', name='ck_product_quantity_non_negative'),
+        Index('ix_product_title_id', 'title', 'id'),
+        Index('ix_product_price_id', 'price', 'id'),
+        Index('ix_product_title_price_id', 'title', 'price', 'id'),
+        Index('ix_product_price_title_id', 'price', 'title', 'id'),
+        Index('ix_product_category_id_price_id', 'category_id', 'price', 'id'),
+        Index('ix_product_author_id_id', 'author_id', 'id'),
+        Index('ix_product_updated_at_id', 'updated_at', 'id'),
+        Index('ix_product_in_stock_id', 'id', postgresql_where=text('quantity > 0')),
+        Index('ix_product_in_stock_price_id', 'price', 'id', postgresql_where=text('quantity > 0')),
+        Index('ix_product_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+        Index('ix_product_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+
+
+class CategoryStats(Base):
+    # Maintained by the product_category_stats_* triggers, see the category_stats migration
+    __tablename__ = 'category_stats'
+    metadata = metadata
+
+    category_id = Column(ForeignKey('category.id', ondelete='CASCADE'), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    min_price = Column(Integer, nullable=True)
+    max_price = Column(Integer, nullable=True)
+
+
+PRODUCT_COLUMNS = [column for column in Product.__table__.columns if column.name != 'search_vector']
+CATEGORY_COLUMNS = list(Category.__table__.columns)
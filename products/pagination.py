@@ -0,0 +1,137 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Any, Optional
+
+from sqlalchemy import Select, and_, or_, false, tuple_
+
+
+def get_sort_keys(ordering_values: Optional[list[str]]) -> list[tuple[str, bool]]:
+    # (field, desc) pairs in sort order; id always closes the key so the order is total.
+    # It follows the direction of the last key so a (column, id) index can serve the sort either way
+    sort_keys = []
+    for field_name in ordering_values or []:
+        desc = field_name.startswith('-')
+        field_name = field_name.replace('-', '').replace('+', '')
+        sort_keys.append((field_name, desc))
+        if field_name == 'id':
+            return sort_keys
+    sort_keys.append(('id', sort_keys[-1][1] if sort_keys else False))
+    return sort_keys
+
+
+def add_tiebreaker(query: Select, model, ordering_values: Optional[list[str]]) -> Select:
+    sort_keys = get_sort_keys(ordering_values)
+    if len(sort_keys) > len(ordering_values or []):
+        _, desc = sort_keys[-1]
+        query = query.order_by(model.id.desc() if desc else model.id.asc())
+    return query
+
+
+# Python types a cursor can carry, timestamps travel as ISO strings and are parsed back by column type
+CURSOR_TYPES = (int, float, str, datetime, date)
+
+
+def get_sort_types(model, sort_keys: list[tuple[str, bool]]) -> list[type]:
+    # ValueError for a sort key a cursor cannot hold, e.g. a tsvector column
+    sort_types = []
+    for field_name, _ in sort_keys:
+        try:
+            python_type = model.__table__.c[field_name].type.python_type
+        except (KeyError, NotImplementedError):
+            raise ValueError(f'Cannot sort by {field_name}')
+        if python_type not in CURSOR_TYPES:
+            raise ValueError(f'Cannot sort by {field_name}')
+        sort_types.append(python_type)
+    return sort_types
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot put {type(value).__name__} into a cursor')
+
+
+def _decode_value(value, python_type: type):
+    if value is None:
+        return None
+    if python_type in (datetime, date):
+        if not isinstance(value, str):
+            raise ValueError('Invalid cursor value')
+        return python_type.fromisoformat(value)
+    if python_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if type(value) is not python_type:
+        raise ValueError('Invalid cursor value')
+    return value
+
+
+def encode_cursor(row, sort_keys: list[tuple[str, bool]]) -> str:
+    payload = {
+        'k': [[field_name, desc] for field_name, desc in sort_keys],
+        'v': [row[field_name] for field_name, _ in sort_keys],
+    }
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False, default=_encode_value).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_keys: list[tuple[str, bool]], sort_types: list[type]) -> list[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        keys = [(field_name, desc) for field_name, desc in payload['k']]
+        values = payload['v']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+    if keys != sort_keys or not isinstance(values, list) or len(values) != len(sort_keys):
+        raise ValueError('Cursor does not match order_by')
+    return [_decode_value(value, python_type) for value, python_type in zip(values, sort_types)]
+
+
+def _is_equal(column, value):
+    if value is None:
+        return column.is_(None)
+    return column == value
+
+
+def _is_after(column, value, desc: bool):
+    # Postgres puts NULLs last for ASC and first for DESC
+    if desc:
+        if value is None:
+            return column.is_not(None)
+        return column < value
+    if value is None:
+        return false()
+    if column.nullable:
+        return or_(column > value, column.is_(None))
+    return column > value
+
+
+def _is_at_or_after(column, value, desc: bool):
+    # Implied by the OR-chain, but unlike it a plain bound on the leading column can drive an index range scan
+    if desc:
+        return column <= value if value is not None else None
+    if value is None:
+        return column.is_(None)
+    if column.nullable:
+        return or_(column >= value, column.is_(None))
+    return column >= value
+
+
+def apply_cursor(query: Select, model, sort_keys: list[tuple[str, bool]], values: list[Any]) -> Select:
+    columns = [model.__table__.c[field_name] for field_name, _ in sort_keys]
+    directions = {desc for _, desc in sort_keys}
+    if len(directions) == 1 and not any(column.nullable for column in columns):
+        # One direction and no NULLs: a row comparison, which Postgres uses as the bound of a (column, id) index
+        if directions.pop():
+            return query.where(tuple_(*columns) < tuple_(*values))
+        return query.where(tuple_(*columns) > tuple_(*values))
+    conditions = []
+    for i, (column, (_, desc), value) in enumerate(zip(columns, sort_keys, values)):
+        prefix = [_is_equal(columns[j], values[j]) for j in range(i)]
+        conditions.append(and_(*prefix, _is_after(column, value, desc)))
+    bound = _is_at_or_after(columns[0], values[0], sort_keys[0][1])
+    if bound is not None:
+        query = query.where(bound)
+    return query.where(or_(*conditions))
@@ -1,15 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi_cache.decorator import cache
 from fastapi_filter import FilterDepends
-from sqlalchemy import select, insert, delete, update
+from sqlalchemy import select, insert, delete, update, func, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from auth.base_config import current_user
-from database import get_async_session
+from auth.base_config import current_user_claims
+from cache import single_flight, namespace_key
+from database import get_async_session, get_read_session, replica_router
+from products.bulk import BulkImport, iter_lines, iter_csv, iter_ndjson
+from products.cache import (PRODUCT_NAMESPACE, PRODUCTS_NAMESPACE, CATEGORIES_NAMESPACE, SEARCH_NAMESPACE,
+                            PRODUCTS_COUNT_NAMESPACE, PRODUCT_EXPIRE, product_key_builder, search_key_builder,
+                            invalidate_product, invalidate_products, invalidate_categories, get_cached_products,
+                            cache_products, product_found, categories_key_builder)
+from products.counts import get_total
+from products.export import iter_export
 from products.filters import ProductFilter, CategoryFilter
 from products.logger import products_logger
-from products.models import Product, Category
-from products.schemas import ProductCreateUpdate, CategoryCreateUpdate
+from products.models import Product, Category, CategoryStats, PRODUCT_COLUMNS, CATEGORY_COLUMNS
+from products.pagination import (get_sort_keys, get_sort_types, add_tiebreaker, encode_cursor, decode_cursor,
+                                 apply_cursor)
+from products.schemas import (ProductCreateUpdate, CategoryCreateUpdate, ProductResponse, ProductListResponse,
+                              ProductSearchResponse, CategoryListResponse, ProductBatchResponse)
+from products.search import normalize_query, build_search_query
 
 products_router = APIRouter(
     prefix='/products',
@@ -17,12 +34,14 @@ products_router = APIRouter(
 )
 
 BASE_PAGE_SIZE = 10
+BATCH_MAX_IDS = 100
 
 
-@products_router.get('/')
-@cache(expire=60, namespace='get_many_products')
-async def get_many_products(page_size: int = BASE_PAGE_SIZE, page: int = 0,
-                            session: AsyncSession = Depends(get_async_session),
+@products_router.get('/', response_model=ProductListResponse, response_model_exclude_unset=True)
+@cache(expire=3600, namespace=PRODUCTS_NAMESPACE)
+@single_flight(expire=3600, namespace=PRODUCTS_NAMESPACE)
+async def get_many_products(page_size: int = BASE_PAGE_SIZE, page: int = 0, cursor: Optional[str] = None,
+                            with_total: bool = False, session: AsyncSession = Depends(get_read_session),
                             product_filter: ProductFilter = FilterDepends(ProductFilter)):
     if page_size > 30:
         raise HTTPException(status_code=400, detail={
@@ -30,17 +49,47 @@ async def get_many_products(page_size: int = BASE_PAGE_SIZE, page: int = 0,
             'data': None,
             'details': 'Количество объектов на странице должно быть меньше 30'
         })
+    sort_keys = get_sort_keys(product_filter.order_by)
+    try:
+        sort_types = get_sort_types(Product, sort_keys)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Сортировка по этому полю не поддерживается'
+        })
+    try:
+        cursor_values = decode_cursor(cursor, sort_keys, sort_types) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Некорректный курсор'
+        })
     try:
-        query = product_filter.filter(select(Product).limit(page_size).offset(page * page_size))
+        query = product_filter.filter(select(*PRODUCT_COLUMNS).limit(page_size))
+        if cursor_values is None:
+            query = query.offset(page * page_size)
+        else:
+            query = apply_cursor(query, Product, sort_keys, cursor_values)
         query = product_filter.sort(query)
+        query = add_tiebreaker(query, Product, product_filter.order_by)
         result = await session.execute(query)
-        return {
+        rows = result.mappings().all()
+        response = {
             'status': 'success',
-            'data': result.mappings().all(),
+            'data': rows,
             'details': None,
             'page': page,
             'page_size': page_size,
+            'next_cursor': encode_cursor(rows[-1], sort_keys) if rows and len(rows) == page_size else None,
         }
+        if with_total:
+            # Cached on its own, all pages and orderings of a filter share one count
+            response['total'], response['total_estimated'] = await get_total(
+                session, product_filter.filter(select(Product.id)), Product.__tablename__,
+                PRODUCTS_COUNT_NAMESPACE, product_filter.model_dump())
+        return response
     except Exception:
         products_logger.error(f'Some get_products error')
         raise HTTPException(status_code=500, detail={
@@ -50,11 +99,106 @@ async def get_many_products(page_size: int = BASE_PAGE_SIZE, page: int = 0,
         })
 
 
-@products_router.get('/{product_id}')
-@cache(expire=3600, namespace='get_product_id')
-async def get_product_id(product_id: int, session: AsyncSession = Depends(get_async_session)):
+@products_router.get('/search', response_model=ProductSearchResponse)
+@cache(expire=600, namespace=SEARCH_NAMESPACE, key_builder=search_key_builder)
+@single_flight(expire=600, namespace=SEARCH_NAMESPACE, key_builder=search_key_builder)
+async def search_products(q: str, limit: int = BASE_PAGE_SIZE, session: AsyncSession = Depends(get_read_session)):
+    if limit > 30:
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Количество объектов на странице должно быть меньше 30'
+        })
+    tokens = normalize_query(q)
+    if not tokens:
+        return {
+            'status': 'success',
+            'data': [],
+            'details': None
+        }
     try:
-        query = select(Product).where(Product.id == product_id)
+        result = await session.execute(build_search_query(tokens, limit))
+        return {
+            'status': 'success',
+            'data': result.mappings().all(),
+            'details': None
+        }
+    except Exception:
+        products_logger.error('Some search_products error')
+        raise HTTPException(status_code=500, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Внутренняя ошибка сервера'
+        })
+
+
+@products_router.get('/export')
+async def export_products(export_format: str = 'ndjson', since: Optional[int] = None,
+                          updated_since: Optional[datetime] = None,
+                          product_filter: ProductFilter = FilterDepends(ProductFilter), user=Depends(current_user_claims)):
+    if not (user.is_superuser or user.is_staff):
+        raise HTTPException(status_code=403, detail={
+            'status': 'forbidden',
+            'data': None,
+            'details': 'У вас недостаточно прав для выгрузки каталога'
+        })
+    if export_format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Формат выгрузки должен быть ndjson или csv'
+        })
+    media_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(iter_export(product_filter, since, export_format, updated_since), media_type=media_type)
+
+
+@products_router.get('/batch', response_model=ProductBatchResponse)
+async def get_products_batch(ids: str, session: AsyncSession = Depends(get_read_session)):
+    try:
+        # dict keeps the first position of a repeated id
+        product_ids = list(dict.fromkeys(int(product_id) for product_id in ids.split(',') if product_id.strip()))
+    except ValueError:
+        product_ids = None
+    if not product_ids or len(product_ids) > BATCH_MAX_IDS or min(product_ids) < 1:
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': f'Нужно передать от 1 до {BATCH_MAX_IDS} id продуктов через запятую'
+        })
+    try:
+        found = await get_cached_products(product_ids)
+        misses = [product_id for product_id in product_ids if product_id not in found]
+        if misses:
+            # One statement whatever the number of ids, the array is a single parameter
+            query = select(*PRODUCT_COLUMNS).where(
+                Product.id == any_(bindparam('ids', misses, type_=ARRAY(Integer)))
+            )
+            with replica_router.refill([namespace_key(PRODUCT_NAMESPACE, product_id) for product_id in misses]):
+                rows = (await session.execute(query)).mappings().all()
+            found.update({row['id']: [row] for row in rows})
+            await cache_products(rows)
+        return {
+            'status': 'success',
+            'data': [row for product_id in product_ids for row in found.get(product_id, [])],
+            'details': None,
+            'missing': [product_id for product_id in product_ids if not found.get(product_id)],
+        }
+    except Exception:
+        products_logger.error('Some get_products_batch error')
+        raise HTTPException(status_code=500, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Внутренняя ошибка сервера'
+        })
+
+
+@products_router.get('/{product_id}', response_model=ProductResponse)
+@cache(expire=PRODUCT_EXPIRE, namespace=PRODUCT_NAMESPACE, key_builder=product_key_builder)
+@single_flight(expire=PRODUCT_EXPIRE, namespace=PRODUCT_NAMESPACE, key_builder=product_key_builder,
+               cacheable=product_found)
+async def get_product_id(product_id: int, session: AsyncSession = Depends(get_read_session)):
+    try:
+        query = select(*PRODUCT_COLUMNS).where(Product.id == product_id)
         result = await session.execute(query)
         return {
             'status': 'success',
@@ -72,12 +216,13 @@ async def get_product_id(product_id: int, session: AsyncSession = Depends(get_as
 
 @products_router.post('/')
 async def add_product(product_data: ProductCreateUpdate, session: AsyncSession = Depends(get_async_session),
-                      user=Depends(current_user)):
+                      user=Depends(current_user_claims)):
     if user.is_superuser or user.is_staff or user.is_seller:
         try:
-            stmt = insert(Product).values(**product_data.dict())
+            stmt = insert(Product).values(**product_data.dict(), author_id=user.id)
             await session.execute(stmt)
             await session.commit()
+            await invalidate_product()
             return {
                 'status': 'success',
                 'data': None,
@@ -98,17 +243,56 @@ async def add_product(product_data: ProductCreateUpdate, session: AsyncSession =
         })
 
 
+@products_router.post('/bulk')
+async def bulk_import_products(request: Request, session: AsyncSession = Depends(get_async_session),
+                               user=Depends(current_user_claims)):
+    if user.is_superuser or user.is_staff or user.is_seller:
+        if request.headers.get('content-type', '').startswith('text/csv'):
+            records = iter_csv(iter_lines(request.stream()))
+        else:
+            records = iter_ndjson(iter_lines(request.stream()))
+        bulk_import = BulkImport(session, author_id=user.id, can_update_any=user.is_superuser or user.is_staff)
+        try:
+            await bulk_import.run(records)
+        except Exception:
+            products_logger.error('Some bulk_import_products error')
+            raise HTTPException(status_code=500, detail={
+                'status': 'error',
+                'data': None,
+                'details': 'Внутренняя ошибка сервера'
+            })
+        finally:
+            if bulk_import.inserted or bulk_import.updated_ids:
+                await invalidate_products(bulk_import.updated_ids)
+        return {
+            'status': 'success',
+            'data': {
+                'inserted': bulk_import.inserted,
+                'updated': len(bulk_import.updated_ids),
+                'errors_count': bulk_import.errors_count,
+                'errors': bulk_import.errors,
+            },
+            'details': 'Импорт завершен'
+        }
+    else:
+        raise HTTPException(status_code=403, detail={
+            'status': 'forbidden',
+            'data': None,
+            'details': 'У вас недостаточно прав для добавления продукта'
+        })
+
+
 @products_router.delete('/{product_id}')
 async def delete_product(product_id: int, session: AsyncSession = Depends(get_async_session),
-                         user=Depends(current_user)):
+                         user=Depends(current_user_claims)):
     if user.is_superuser or user.is_staff:
         try:
-            query = select(Product).where(Product.id == product_id)
-            result = await session.execute(query)
-            if result.mappings().first():
-                stmt = delete(Product).where(Product.id == product_id)
-                await session.execute(stmt)
+            stmt = delete(Product).where(Product.id == product_id).returning(Product.id)
+            result = await session.execute(stmt)
+            deleted_id = result.scalar_one_or_none()
+            if deleted_id is not None:
                 await session.commit()
+                await invalidate_product(deleted_id)
                 return {
                     'status': 'success',
                     'data': None,
@@ -137,40 +321,43 @@ async def delete_product(product_id: int, session: AsyncSession = Depends(get_as
 
 @products_router.put('/{product_id}')
 async def update_product(product_id: int, product_data: ProductCreateUpdate,
-                         session: AsyncSession = Depends(get_async_session), user=Depends(current_user)):
-    if user.is_superuser or user.is_staff or Product.author_id == user.id:
-        try:
-            query = select(Product).where(Product.id == product_id)
-            result = await session.execute(query)
-
-            if result.mappings().first():
-                stmt = update(Product).where(Product.id == product_id).values(**product_data.dict())
-                await session.execute(stmt)
-                await session.commit()
-                return {
-                    'status': 'success',
-                    'data': None,
-                    'details': 'Продукт обновлен!'
-                }
-            else:
-                return {
-                    'status': 'not_found',
-                    'data': None,
-                    'details': 'Продукт не найден'
-                }
-        except Exception:
-            products_logger.error('Some update_product error')
-            raise HTTPException(status_code=500, detail={
-                'status': 'error',
+                         session: AsyncSession = Depends(get_async_session), user=Depends(current_user_claims)):
+    can_update_any = user.is_superuser or user.is_staff
+    try:
+        stmt = update(Product).where(Product.id == product_id).values(**product_data.dict()).returning(Product.id)
+        if not can_update_any:
+            stmt = stmt.where(Product.author_id == user.id)
+        result = await session.execute(stmt)
+        updated_id = result.scalar_one_or_none()
+        if updated_id is not None:
+            await session.commit()
+            await invalidate_product(updated_id)
+            return {
+                'status': 'success',
                 'data': None,
-                'details': 'Внутренняя ошибка сервера'
-            })
-    else:
+                'details': 'Продукт обновлен!'
+            }
+        # The author filter makes another seller's product look missing to the UPDATE. Staff never need the lookup,
+        # sellers only when their update matched nothing
+        forbidden = not can_update_any and await session.scalar(select(Product.id).where(Product.id == product_id))
+    except Exception:
+        products_logger.error('Some update_product error')
+        raise HTTPException(status_code=500, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Внутренняя ошибка сервера'
+        })
+    if forbidden:
         raise HTTPException(status_code=403, detail={
             'status': 'forbidden',
             'data': None,
             'details': 'У вас недостаточно прав для обновления продукта'
         })
+    return {
+        'status': 'not_found',
+        'data': None,
+        'details': 'Продукт не найден'
+    }
 
 
 categories_router = APIRouter(
@@ -179,10 +366,11 @@ categories_router = APIRouter(
 )
 
 
-@categories_router.get('/')
-@cache(expire=3600, namespace='get_categories')
-async def get_categories(page_size: int = BASE_PAGE_SIZE, page: int = 0,
-                         session: AsyncSession = Depends(get_async_session),
+@categories_router.get('/', response_model=CategoryListResponse, response_model_exclude_unset=True)
+@cache(expire=21600, namespace=CATEGORIES_NAMESPACE, key_builder=categories_key_builder)
+@single_flight(expire=21600, namespace=CATEGORIES_NAMESPACE, key_builder=categories_key_builder)
+async def get_categories(page_size: int = BASE_PAGE_SIZE, page: int = 0, cursor: Optional[str] = None,
+                         with_stats: bool = False, session: AsyncSession = Depends(get_read_session),
                          category_filter: CategoryFilter = FilterDepends(CategoryFilter)):
     if page_size > 30:
         raise HTTPException(status_code=400, detail={
@@ -190,16 +378,47 @@ async def get_categories(page_size: int = BASE_PAGE_SIZE, page: int = 0,
             'data': None,
             'details': 'Количество объектов на странице должно быть меньше 30'
         })
+    sort_keys = get_sort_keys(category_filter.order_by)
+    try:
+        sort_types = get_sort_types(Category, sort_keys)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Сортировка по этому полю не поддерживается'
+        })
     try:
-        query = select(Category).limit(page_size).offset(page * page_size)
+        cursor_values = decode_cursor(cursor, sort_keys, sort_types) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail={
+            'status': 'error',
+            'data': None,
+            'details': 'Некорректный курсор'
+        })
+    try:
+        query = select(*CATEGORY_COLUMNS).limit(page_size)
+        if with_stats:
+            # Read from the trigger maintained table, a page costs the same however many products there are
+            query = query.outerjoin(CategoryStats, CategoryStats.category_id == Category.id).add_columns(
+                func.coalesce(CategoryStats.product_count, 0).label('product_count'),
+                CategoryStats.min_price,
+                CategoryStats.max_price,
+            )
+        if cursor_values is None:
+            query = query.offset(page * page_size)
+        else:
+            query = apply_cursor(query, Category, sort_keys, cursor_values)
         query = category_filter.sort(query)
+        query = add_tiebreaker(query, Category, category_filter.order_by)
         result = await session.execute(query)
+        rows = result.mappings().all()
         return {
             'status': 'success',
-            'data': result.mappings().all(),
+            'data': rows,
             'details': None,
             'page': page,
-            'page_size': page_size
+            'page_size': page_size,
+            'next_cursor': encode_cursor(rows[-1], sort_keys) if rows and len(rows) == page_size else None,
         }
     except Exception:
         products_logger.error(f'Some get_categories error')
@@ -212,12 +431,13 @@ async def get_categories(page_size: int = BASE_PAGE_SIZE, page: int = 0,
 
 @categories_router.post('/')
 async def add_category(category_data: CategoryCreateUpdate, session: AsyncSession = Depends(get_async_session),
-                       user=Depends(current_user)):
+                       user=Depends(current_user_claims)):
     if user.is_superuser or user.is_staff:
         try:
             stmt = insert(Category).values(**category_data.dict())
             await session.execute(stmt)
             await session.commit()
+            await invalidate_categories()
             return {
                 'status': 'success',
                 'data': None,
@@ -240,16 +460,15 @@ async def add_category(category_data: CategoryCreateUpdate, session: AsyncSessio
 
 @categories_router.delete('/{category_id}')
 async def delete_category(category_id: int, session: AsyncSession = Depends(get_async_session),
-                          user=Depends(current_user)):
+                          user=Depends(current_user_claims)):
     if user.is_superuser or user.is_staff:
         try:
-            query = select(Category).where(Category.id == category_id)
-            result = await session.execute(query)
+            stmt = delete(Category).where(Category.id == category_id).returning(Category.id)
+            result = await session.execute(stmt)
 
-            if result.mappings().all():
-                stmt = delete(Category).where(Category.id == category_id)
-                await session.execute(stmt)
+            if result.scalar_one_or_none() is not None:
                 await session.commit()
+                await invalidate_categories()
 
                 return {
                     'status': 'success',
@@ -279,16 +498,16 @@ async def delete_category(category_id: int, session: AsyncSession = Depends(get_
 
 @categories_router.put('/{category_id}')
 async def update_category(category_id: int, category_data: CategoryCreateUpdate,
-                          session: AsyncSession = Depends(get_async_session), user=Depends(current_user)):
+                          session: AsyncSession = Depends(get_async_session), user=Depends(current_user_claims)):
     if user.is_superuser or user.is_staff:
         try:
-            query = select(Category).where(Category.id == category_id)
-            result = await session.execute(query)
+            stmt = (update(Category).where(Category.id == category_id).values(**category_data.dict())
+                    .returning(Category.id))
+            result = await session.execute(stmt)
 
-            if result.mappings().all():
-                stmt = update(Category).where(Category.id == category_id).values(**category_data.dict())
-                await session.execute(stmt)
+            if result.scalar_one_or_none() is not None:
                 await session.commit()
+                await invalidate_categories()
 
                 return {
                     'status': 'success',
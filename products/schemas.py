@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel, Field
@@ -11,5 +12,69 @@ class ProductCreateUpdate(BaseModel):
     quantity: int = Field(ge=0)
 
 
+class ProductBulkRow(ProductCreateUpdate):
+    id: Optional[int] = Field(default=None, ge=1)
+
+
 class CategoryCreateUpdate(BaseModel):
     title: str = Field(max_length=50)
+
+
+class ProductRead(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    price: int
+    quantity: int
+    category_id: Optional[int] = None
+    author_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+
+class ProductSearchRead(ProductRead):
+    rank: float
+
+
+class CategoryRead(BaseModel):
+    id: int
+    title: str
+    updated_at: Optional[datetime] = None
+    # Only with with_stats=true
+    product_count: Optional[int] = None
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+
+
+class ProductResponse(BaseModel):
+    status: str
+    data: list[ProductRead]
+    details: Optional[str] = None
+
+
+class ProductBatchResponse(ProductResponse):
+    # Requested ids with no product, data holds the others in the requested order
+    missing: list[int]
+
+
+class ProductListResponse(ProductResponse):
+    page: int
+    page_size: int
+    next_cursor: Optional[str] = None
+    # Only with with_total=true. total_estimated marks a planner estimate instead of an exact count
+    total: Optional[int] = None
+    total_estimated: Optional[bool] = None
+
+
+class ProductSearchResponse(BaseModel):
+    status: str
+    data: list[ProductSearchRead]
+    details: Optional[str] = None
+
+
+class CategoryListResponse(BaseModel):
+    status: str
+    data: list[CategoryRead]
+    details: Optional[str] = None
+    page: int
+    page_size: int
+    next_cursor: Optional[str] = None
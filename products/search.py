@@ -0,0 +1,32 @@
+import re
+
+from sqlalchemy import select, func
+
+from products.models import Product, PRODUCT_COLUMNS
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+MAX_TOKENS = 8
+MIN_PREFIX_LENGTH = 2
+
+
+def normalize_query(q: str) -> list[str]:
+    return TOKEN_RE.findall(q.lower())[:MAX_TOKENS]
+
+
+def to_tsquery_text(tokens: list[str]) -> str:
+    # The last word is still being typed, so it matches as a prefix once it is long enough to be selective
+    *words, last = tokens
+    if len(last) >= MIN_PREFIX_LENGTH:
+        last = f'{last}:*'
+    return ' & '.join([*words, last])
+
+
+def build_search_query(tokens: list[str], limit: int):
+    tsquery = func.to_tsquery('simple', to_tsquery_text(tokens))
+    rank = func.ts_rank(Product.search_vector, tsquery)
+    return (
+        select(*PRODUCT_COLUMNS, rank.label('rank'))
+        .where(Product.search_vector.op('@@')(tsquery))
+        .order_by(rank.desc(), Product.id)
+        .limit(limit)
+    )
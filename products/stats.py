@@ -0,0 +1,62 @@
+import asyncio
+
+from fastapi_cache import FastAPICache
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import CATEGORY_STATS_REFRESH_INTERVAL
+from database import async_session_maker
+from products.cache import invalidate_category_stats
+from products.logger import products_logger
+from products.models import Category, CategoryStats, Product
+
+
+CATEGORY_STATS_LOCK = 'category_stats:refresh'
+
+
+async def refresh_category_stats(session: AsyncSession) -> bool:
+    # Corrects any drift of the trigger maintained rows without blocking readers or the whole table.
+    # One short transaction per category: the stats row is locked before the count is taken, so a product
+    # write either committed before it and is counted, or waits and applies its delta on top.
+    # True when a row was added or corrected
+    result = await session.execute(insert(CategoryStats).from_select(['category_id'], select(Category.id))
+                                   .on_conflict_do_nothing(index_elements=['category_id']))
+    changed = result.rowcount > 0
+    await session.commit()
+    for category_id in (await session.scalars(select(CategoryStats.category_id))).all():
+        await session.execute(select(CategoryStats.category_id).where(CategoryStats.category_id == category_id)
+                              .with_for_update())
+        count, min_price, max_price = (await session.execute(
+            select(func.count(Product.id), func.min(Product.price), func.max(Product.price))
+            .where(Product.category_id == category_id)
+        )).one()
+        result = await session.execute(
+            update(CategoryStats)
+            .where(CategoryStats.category_id == category_id,
+                   or_(CategoryStats.product_count != count, CategoryStats.min_price.is_distinct_from(min_price),
+                       CategoryStats.max_price.is_distinct_from(max_price)))
+            .values(product_count=count, min_price=min_price, max_price=max_price)
+        )
+        changed = changed or result.rowcount > 0
+        await session.commit()
+    return changed
+
+
+async def maintain_category_stats() -> None:
+    while True:
+        await asyncio.sleep(CATEGORY_STATS_REFRESH_INTERVAL)
+        try:
+            # Once per interval for the whole fleet: the first worker to wake up takes the lock, and it is left
+            # to expire, so the others skip this round
+            if not await FastAPICache.get_backend().acquire_lock(CATEGORY_STATS_LOCK,
+                                                                 max(int(CATEGORY_STATS_REFRESH_INTERVAL), 1)):
+                continue
+            async with async_session_maker() as session:
+                changed = await refresh_category_stats(session)
+            if changed:
+                await invalidate_category_stats()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            products_logger.error('Some maintain_category_stats error')
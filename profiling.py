@@ -0,0 +1,167 @@
+import asyncio
+import re
+from collections import Counter, deque
+from contextvars import Context, ContextVar
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from auth.base_config import current_user_claims
+from config import DEBUG, SQL_SLOW_QUERY_MS, SQL_N_PLUS_ONE_THRESHOLD, SQL_PROFILE_BUFFER_SIZE
+from logger import log_context, setup_logger
+from metrics import get_route, query_observers
+
+SLOWEST_LIMIT = 5
+# Row locking reads, EXPLAIN ANALYZE would take their locks a second time
+LOCKING_CLAUSE = re.compile(r'\bFOR\s+(UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b', re.IGNORECASE)
+
+sql_logger = setup_logger('sql_logger', 'sql')
+
+# Profiles of the last requests served by this worker
+profiles: deque = deque(maxlen=SQL_PROFILE_BUFFER_SIZE)
+
+# Statements of the request being served, None outside of requests
+request_statements: ContextVar[Optional[list]] = ContextVar('request_statements', default=None)
+
+# Referenced until done, the event loop only keeps weak references to tasks
+explain_tasks: set[asyncio.Task] = set()
+
+
+def redact(parameters) -> object:
+    # Keeps the shape of the parameters, never the values
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f'{len(parameters)} rows'
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+def record_statement(async_engine, statement: str, parameters, seconds: float, executemany: bool) -> None:
+    # A metrics.query_observers entry, timed by the same hook as the per-request query metrics
+    statements = request_statements.get()
+    if statements is None:
+        return
+    duration_ms = seconds * 1000
+    statements.append({
+        'statement': statement,
+        'parameters': parameters,
+        'duration_ms': duration_ms,
+        'engine': async_engine,
+        'executemany': executemany,
+    })
+    if duration_ms >= SQL_SLOW_QUERY_MS:
+        sql_logger.warning(f'Slow query {duration_ms:.1f}ms: {statement}')
+
+
+async def explain(item: dict) -> Optional[str]:
+    # EXPLAIN ANALYZE runs the statement again, so only plain reads qualify
+    statement = item['statement']
+    if item['executemany'] or not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    if LOCKING_CLAUSE.search(statement):
+        return None
+    try:
+        async with item['engine'].connect() as conn:
+            result = await conn.exec_driver_sql(f'EXPLAIN ANALYZE {statement}', item['parameters'])
+            return '\n'.join(row[0] for row in result)
+    except Exception:
+        sql_logger.error('Some explain error')
+        return None
+
+
+def summarize(statements: list[dict]) -> dict:
+    repeated = Counter(item['statement'] for item in statements)
+    slowest = sorted(statements, key=lambda item: item['duration_ms'], reverse=True)[:SLOWEST_LIMIT]
+    return {
+        'statements': len(statements),
+        'db_time_ms': round(sum(item['duration_ms'] for item in statements), 2),
+        'slowest': [
+            {
+                'statement': item['statement'],
+                'parameters': redact(item['parameters']),
+                'duration_ms': round(item['duration_ms'], 2),
+            }
+            for item in slowest
+        ],
+        'n_plus_one': [
+            {'statement': statement, 'count': count}
+            for statement, count in repeated.items() if count >= SQL_N_PLUS_ONE_THRESHOLD
+        ],
+    }
+
+
+class SQLProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        statements = []
+        token = request_statements.set(statements)
+
+        async def send_with_profile(message):
+            if DEBUG and message['type'] == 'http.response.start':
+                summary = summarize(statements)
+                header = (f"statements={summary['statements']}; db_time_ms={summary['db_time_ms']}; "
+                          f"n_plus_one={len(summary['n_plus_one'])}")
+                message['headers'] = [*message.get('headers', []), (b'x-sql-profile', header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            request_statements.reset(token)
+            context = log_context.get() or {}
+            profile = {
+                'request_id': context.get('request_id'),
+                'method': scope['method'],
+                'route': get_route(scope),
+                **summarize(statements),
+                'explain': [],
+            }
+            profiles.append(profile)
+            slow = [item for item in statements if item['duration_ms'] >= SQL_SLOW_QUERY_MS]
+            if slow:
+                # Detached and in an empty context: the request's latency and query metrics leave the plans out
+                task = asyncio.create_task(explain_slow(profile, slow), context=Context())
+                explain_tasks.add(task)
+                task.add_done_callback(explain_tasks.discard)
+
+
+async def explain_slow(profile: dict, statements: list[dict]) -> None:
+    for item in statements:
+        plan = await explain(item)
+        if plan is not None:
+            profile['explain'].append({'statement': item['statement'], 'plan': plan})
+
+
+profiling_router = APIRouter(
+    prefix='/debug',
+    tags=['debug']
+)
+
+
+@profiling_router.get('/sql')
+async def get_sql_profiles(user=Depends(current_user_claims)):
+    if not (user.is_superuser or user.is_staff):
+        raise HTTPException(status_code=403, detail={
+            'status': 'forbidden',
+            'data': None,
+            'details': 'У вас недостаточно прав для просмотра профиля запросов'
+        })
+    return {
+        'status': 'success',
+        'data': list(profiles),
+        'details': None
+    }
+
+
+def setup_profiling(app) -> None:
+    query_observers.append(record_statement)
+    app.add_middleware(SQLProfilerMiddleware)
+    app.include_router(profiling_router)
@@ -1,34 +1,133 @@
+import json
+import os
 import smtplib
 from email.message import EmailMessage
 
 from celery import Celery
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from redis import Redis
 
-from config import SMTP_USER, SMTP_PASS, REDIS_PORT, REDIS_HOST
+from config import (SMTP_USER, SMTP_PASS, REDIS_PORT, REDIS_HOST, SMTP_HOST, SMTP_PORT, SMTP_SSL, SMTP_MAX_IDLE,
+                    SMTP_RATE_LIMIT, SMTP_BATCH_SIZE, SMTP_BATCH_WINDOW, SMTP_MAX_RETRIES, SMTP_RETRY_BACKOFF)
+from tasks.smtp import SMTPPool
 
 celery = Celery('celery_app', broker=f'redis://{REDIS_HOST}:{REDIS_PORT}')
-SMTP_HOST = "smtp.gmail.com"
-SMTP_PORT = 465
+redis = Redis(host=REDIS_HOST, port=REDIS_PORT)
+smtp_pool = SMTPPool(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, use_ssl=SMTP_SSL, max_idle=SMTP_MAX_IDLE,
+                     rate=SMTP_RATE_LIMIT)
+logger = get_task_logger(__name__)
 
+EMAIL_QUEUE_KEY = 'emails:pending'
+EMAIL_FLUSH_KEY = 'emails:flush_scheduled'
+# Messages the server rejected for good, kept for inspection or a manual requeue
+EMAIL_DEAD_KEY = 'emails:dead'
 
-def get_email_template(username: str, token: str):
+EMAIL_VERIFY = 'verify'
+EMAIL_RESET_PASSWORD = 'reset_password'
+EMAIL_SUBJECTS = {
+    EMAIL_VERIFY: 'Some Store: подтверждение почты',
+    EMAIL_RESET_PASSWORD: 'Some Store: сброс пароля',
+}
+
+# Compiled once at import, rendering a message is then a plain function call
+template_env = Environment(loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')),
+                           autoescape=select_autoescape(), auto_reload=False)
+email_templates = {kind: template_env.get_template(f'{kind}.html') for kind in EMAIL_SUBJECTS}
+
+
+def get_email_template(username: str, token: str, kind: str = EMAIL_VERIFY):
     email = EmailMessage()
-    email['Subject'] = 'Some Store'
+    email['Subject'] = EMAIL_SUBJECTS[kind]
     email['From'] = SMTP_USER
     email['To'] = username
 
-    email.set_content(
-        '<div>'
-        f'<h1>Здравствуйте, {username}, вот ваш токен:</h1>'
-        f'<h2>{token}</h2>'
-        '</div>',
-        subtype='html'
-    )
+    email.set_content(email_templates[kind].render(username=username, token=token), subtype='html')
     return email
 
 
+def enqueue_emails(messages: list[tuple]) -> None:
+    # Messages wait in a Redis list, the first one of a burst schedules a single flush for the whole burst
+    redis.rpush(EMAIL_QUEUE_KEY, *[json.dumps(message) for message in messages])
+    if redis.set(EMAIL_FLUSH_KEY, 1, nx=True, ex=int(SMTP_BATCH_WINDOW) + 60):
+        flush_emails.apply_async(countdown=SMTP_BATCH_WINDOW)
+
+
+def is_transient(exc: Exception) -> bool:
+    # 4xx replies and dropped connections may go through later, a 5xx reply to the message will not.
+    # Failing to connect or log in says nothing about the message, so it stays queued
+    if isinstance(exc, (smtplib.SMTPConnectError, smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError,
+                        smtplib.SMTPServerDisconnected)):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code < 500
+    # SMTPException subclasses OSError, anything else from smtplib is a protocol error
+    return not isinstance(exc, smtplib.SMTPException)
+
+
+def schedule_flush(countdown: float) -> None:
+    # Holding the flag meanwhile keeps enqueue_emails from scheduling a second flush
+    redis.set(EMAIL_FLUSH_KEY, 1, ex=int(countdown) + 60)
+    flush_emails.apply_async(countdown=countdown)
+
+
+@celery.task
+def send_email(username: str, token: str, kind: str = EMAIL_VERIFY):
+    enqueue_emails([(username, token, kind)])
+
+
 @celery.task
-def send_email(username: str, token: str):
-    email = get_email_template(username, token)
-    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-        server.login(SMTP_USER, SMTP_PASS)
-        server.send_message(email)
+def send_emails(messages: list[list[str]]):
+    # One broker message for a whole batch of the outbox relay
+    enqueue_emails(messages)
+
+
+@celery.task(bind=True, max_retries=SMTP_MAX_RETRIES)
+def flush_emails(self):
+    # Cleared first: a message queued while we drain is either picked up here or schedules the next flush
+    redis.delete(EMAIL_FLUSH_KEY)
+    while True:
+        batch = redis.lpop(EMAIL_QUEUE_KEY, SMTP_BATCH_SIZE)
+        if not batch:
+            return
+        for index, raw in enumerate(batch):
+            try:
+                # [username, token] entries queued before kinds existed are verification emails
+                username, token, *kind = json.loads(raw)
+                email = get_email_template(username, token, *kind)
+            except Exception as exc:
+                # Popped already, a message that cannot be built would otherwise be lost with the exception
+                redis.rpush(EMAIL_DEAD_KEY, raw)
+                logger.error(f'Email could not be built, moved to {EMAIL_DEAD_KEY}: {exc!r}')
+                continue
+            try:
+                smtp_pool.send(email)
+            except (smtplib.SMTPException, OSError) as exc:
+                if not is_transient(exc):
+                    redis.rpush(EMAIL_DEAD_KEY, raw)
+                    logger.error(f'Email to {username} rejected, moved to {EMAIL_DEAD_KEY}: {exc!r}')
+                    continue
+                smtp_pool.close()
+                # Unsent messages go back to the head of the queue in their order
+                redis.lpush(EMAIL_QUEUE_KEY, *reversed(batch[index:]))
+                countdown = SMTP_RETRY_BACKOFF * 2 ** self.request.retries
+                if self.request.retries >= self.max_retries:
+                    # The flag was cleared when this flush started, without a new flush the queue would only
+                    # move again on the next enqueue
+                    logger.error(f'Email flush out of retries, next attempt in {countdown}s: {exc!r}')
+                    schedule_flush(countdown)
+                    return
+                redis.set(EMAIL_FLUSH_KEY, 1, ex=int(countdown) + 60)
+                raise self.retry(exc=exc, countdown=countdown)
+            except Exception as exc:
+                # Anything else, e.g. a message the SMTP client cannot encode, fails the same way on every attempt
+                redis.rpush(EMAIL_DEAD_KEY, raw)
+                logger.error(f'Email to {username} failed, moved to {EMAIL_DEAD_KEY}: {exc!r}')
+
+
+@worker_process_shutdown.connect
+def close_smtp_connection(**kwargs):
+    smtp_pool.close()
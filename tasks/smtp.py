@@ -0,0 +1,68 @@
+import smtplib
+import time
+from email.message import EmailMessage
+from typing import Optional
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = 0.0
+
+    def wait(self) -> None:
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+class SMTPPool:
+    # One long-lived connection per worker process. It is opened on first use, after the fork,
+    # and replaced when the server has dropped it
+
+    def __init__(self, host: str, port: int, user: Optional[str], password: Optional[str], use_ssl: bool = True,
+                 max_idle: float = 60, rate: float = 0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.max_idle = max_idle
+        self.limiter = RateLimiter(rate)
+        self.server: Optional[smtplib.SMTP] = None
+        self.last_used = 0.0
+
+    def connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP_SSL(self.host, self.port) if self.use_ssl else smtplib.SMTP(self.host, self.port)
+        if self.user:
+            server.login(self.user, self.password)
+        return server
+
+    def connection(self) -> smtplib.SMTP:
+        if self.server is not None and time.monotonic() - self.last_used > self.max_idle:
+            # Servers close idle sessions, better to find out before sending
+            try:
+                self.server.noop()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self.server is None:
+            self.server = self.connect()
+        return self.server
+
+    def send(self, email: EmailMessage) -> None:
+        self.limiter.wait()
+        try:
+            self.connection().send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.connection().send_message(email)
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None